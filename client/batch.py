@@ -0,0 +1,67 @@
+import json
+import time
+import asyncio
+from typing import Optional, TextIO
+from line_reader import AsyncLineReader
+
+
+def parse_batch_line(line: str, line_number: int) -> tuple[str, str]:
+    """Return (id, query) for one JSONL input line: {"id": ..., "query": ...} or a bare JSON string."""
+    item = json.loads(line)
+    if isinstance(item, str):
+        return str(line_number), item
+    if not isinstance(item, dict) or not isinstance(item.get("query"), str):
+        raise ValueError('expected a JSON string or an object with a "query" string')
+    return str(item.get("id", line_number)), item["query"]
+
+
+async def run_batch(client, source: TextIO, output: TextIO, parallelism: int = 4) -> dict:
+    """Run JSONL queries from source with up to `parallelism` in flight, writing one result line per query.
+
+    Every query gets its own conversation, so they don't see each other's turns, while
+    all of them share the client's server sessions. Results are written in completion order.
+    """
+    reader = AsyncLineReader(source)
+    reader.start()
+    # Bounded so a huge input file isn't read far ahead of the workers
+    pending: asyncio.Queue[Optional[tuple[int, str]]] = asyncio.Queue(maxsize=parallelism * 2)
+    stats = {"ok": 0, "failed": 0}
+
+    def write(record: dict):
+        output.write(json.dumps(record, default=str) + "\n")
+        output.flush()
+        stats["ok" if "response" in record else "failed"] += 1
+
+    async def feed():
+        line_number = 0
+        while (line := await reader.readline()) is not None:
+            line_number += 1
+            if line.strip():
+                await pending.put((line_number, line))
+        for _ in range(parallelism):
+            await pending.put(None)
+
+    async def work():
+        while (item := await pending.get()) is not None:
+            line_number, line = item
+            try:
+                query_id, query = parse_batch_line(line, line_number)
+            except ValueError as e:
+                write({"id": str(line_number), "error": f"invalid input line: {e}"})
+                continue
+            conversation = client.new_conversation()
+            record = {"id": query_id, "query": query, "session_id": conversation.session_id}
+            started_at = time.time()
+            started = time.perf_counter()
+            try:
+                record["response"] = await client.process_query(query, conversation)
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["started_at"] = started_at
+            record["duration"] = round(time.perf_counter() - started, 4)
+            write(record)
+
+    started = time.perf_counter()
+    await asyncio.gather(feed(), *(work() for _ in range(parallelism)))
+    stats["duration"] = round(time.perf_counter() - started, 4)
+    return stats
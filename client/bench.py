@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import contextlib
+from typing import Optional
+from google.genai import types
+from client import MCPClient
+
+BENCH_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_server.py")
+CHARS_PER_TOKEN = 4
+
+# Each scenario is the list of model turns for one query. A turn is a list of
+# ("call", tool name, args) or ("text", text) parts.
+SCENARIOS = {
+    "single-tool": [
+        [("call", "alpha_lookup", {"key": "user-1"})],
+        [("text", "Found user-1.")],
+    ],
+    "multi-tool": [
+        [
+            ("call", "alpha_lookup", {"key": "user-1"}),
+            ("call", "alpha_compute", {"expression": "6 * 7"}),
+            ("call", "beta_lookup", {"key": "order-9"}),
+            ("call", "beta_fetch", {"url": "https://example.com/a"}),
+        ],
+        [("text", "Here is everything you asked for.")],
+    ],
+    "multi-iteration": [
+        [("call", "alpha_lookup", {"key": "user-1"})],
+        [("call", "beta_lookup", {"key": "order-9"})],
+        [("call", "alpha_compute", {"expression": "6 * 7"})],
+        [("text", "Done after three steps.")],
+    ],
+    "large-result": [
+        [("call", "beta_fetch", {"url": "https://example.com/big", "size": 256 * 1024})],
+        [("text", "The document is long; here is the gist.")],
+    ],
+}
+
+
+class ScriptedModels:
+    """Deterministic stand-in for genai_client.aio.models that replays a scenario script.
+
+    The turn to play is derived from the contents (model turns since the last user
+    prompt), so it holds no per-query state and works for concurrent queries.
+    """
+
+    def __init__(self, script: list, latency: float = 0.0):
+        self.script = script
+        self.latency = latency
+        self.calls = 0
+
+    def _response(self, contents) -> types.GenerateContentResponse:
+        self.calls += 1
+        if isinstance(contents, str):
+            # Conversation summarization
+            parts = [types.Part.from_text(text="Summary of earlier turns.")]
+            prompt_chars = len(contents)
+        else:
+            step = 0
+            for content in reversed(contents):
+                if content.role == "user" and any(part.text for part in content.parts or []):
+                    break
+                if content.role == "model":
+                    step += 1
+            turn = self.script[min(step, len(self.script) - 1)]
+            parts = [
+                types.Part(function_call=types.FunctionCall(name=spec[1], args=spec[2]))
+                if spec[0] == "call" else types.Part.from_text(text=spec[1])
+                for spec in turn
+            ]
+            prompt_chars = sum(len(content.model_dump_json(exclude_none=True)) for content in contents)
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_chars // CHARS_PER_TOKEN,
+                candidates_token_count=8,
+                total_token_count=prompt_chars // CHARS_PER_TOKEN + 8,
+            ),
+        )
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        return self._response(contents)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        response = self._response(contents)
+
+        async def chunks():
+            # One chunk per part, like a streamed reply with several function calls
+            for part in response.candidates[0].content.parts:
+                yield types.GenerateContentResponse(
+                    candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))],
+                    usage_metadata=response.usage_metadata,
+                )
+
+        return chunks()
+
+
+class ScriptedGemini:
+    """Minimal genai.Client replacement: only the aio.models surface MCPClient uses."""
+
+    def __init__(self, script: list, latency: float = 0.0):
+        self.aio = type("Aio", (), {})()
+        self.aio.models = ScriptedModels(script, latency)
+
+    def set_script(self, script: list):
+        self.aio.models.script = script
+
+
+def bench_server_configs(tool_latency: float, payload: int, startup_delay: float = 0.0) -> dict:
+    return {
+        name: {
+            "command": sys.executable,
+            "args": [
+                BENCH_SERVER, "--name", name,
+                "--latency", str(tool_latency),
+                "--payload", str(payload),
+                "--startup-delay", str(startup_delay),
+            ],
+        }
+        for name in ("alpha", "beta")
+    }
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def quiet(args):
+    """Hide the client's progress output unless --verbose."""
+    stack = contextlib.ExitStack()
+    if not args.verbose:
+        # The stack owns the devnull handle, so it is closed when the block exits
+        devnull = stack.enter_context(open(os.devnull, "w"))
+        stack.enter_context(contextlib.redirect_stdout(devnull))
+    return stack
+
+
+def make_client(args, gemini: ScriptedGemini, manifest_dir: Optional[str]) -> MCPClient:
+    return MCPClient(
+        genai_client=gemini,
+        stream=args.stream,
+        tool_manifest_dir=manifest_dir,
+        session_store_path=None,
+        trace_path=None,
+    )
+
+
+async def bench_startup(args, manifest_dir: str) -> dict:
+    """Time connect_to_servers without (cold) and with (warm) the tool manifest cache."""
+    results = {}
+    for label, directory in (("cold", None), ("warm", manifest_dir)):
+        samples = []
+        # The first warm run writes the manifests, so it isn't measured
+        runs = args.startup_runs + (1 if directory else 0)
+        for run in range(runs):
+            client = make_client(args, ScriptedGemini([]), directory)
+            started_at = time.perf_counter()
+            with quiet(args):
+                await client.connect_to_servers(
+                    bench_server_configs(args.tool_latency, args.payload, args.server_startup_delay)
+                )
+            if not directory or run > 0:
+                samples.append(time.perf_counter() - started_at)
+            with quiet(args):
+                await client.cleanup()
+        results[label] = summarize(samples)
+    return results
+
+
+async def bench_queries(args, manifest_dir: str) -> dict:
+    """Run every selected scenario args.queries times against one connected client."""
+    gemini = ScriptedGemini([], latency=args.llm_latency)
+    client = make_client(args, gemini, manifest_dir)
+    results = {}
+    try:
+        with quiet(args):
+            await client.connect_to_servers(bench_server_configs(args.tool_latency, args.payload))
+        for name in args.scenarios:
+            gemini.set_script(SCENARIOS[name])
+            client.memory.clear()
+            rss_before = rss_mb()
+            samples = []
+            with quiet(args):
+                for _ in range(args.warmup):
+                    await client.process_query(f"benchmark {name}")
+                for i in range(args.queries):
+                    started_at = time.perf_counter()
+                    await client.process_query(f"benchmark {name} #{i}")
+                    samples.append(time.perf_counter() - started_at)
+            results[name] = summarize(samples)
+            results[name]["rss_mb"] = round(rss_mb(), 1)
+            results[name]["rss_growth_mb"] = round(rss_mb() - rss_before, 1)
+    finally:
+        with quiet(args):
+            await client.cleanup()
+    return results
+
+
+def print_table(title: str, results: dict):
+    print(f"\n{title}")
+    print(f"{'':<18} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'rss MB':>8}")
+    for name, row in results.items():
+        rss = f"{row['rss_mb']:>8.1f}" if "rss_mb" in row else ""
+        print(
+            f"{name:<18} {row['runs']:>5} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+            f"{row['p99_ms']:>9.2f} {row['max_ms']:>9.2f} {rss}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Offline MCPClient benchmark: scripted Gemini replies against stub stdio MCP servers."
+    )
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--queries", type=int, default=50, help="measured queries per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured queries per scenario")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="seconds per stub tool call")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per scripted Gemini call")
+    parser.add_argument("--payload", type=int, default=256, help="default stub tool result size in bytes")
+    parser.add_argument("--server-startup-delay", type=float, default=0.0, help="seconds each stub server sleeps on launch")
+    parser.add_argument("--stream", action="store_true", help="benchmark the streaming path")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON, e.g. for CI comparison")
+    parser.add_argument("--verbose", action="store_true", help="show the client's own output")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    with tempfile.TemporaryDirectory() as manifest_dir:
+        startup = await bench_startup(args, manifest_dir)
+        queries = await bench_queries(args, manifest_dir)
+
+    print_table("Startup (connect_to_servers)", startup)
+    print_table("Query latency (process_query)", queries)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"startup": startup, "queries": queries, "config": vars(args)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
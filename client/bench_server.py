@@ -0,0 +1,40 @@
+import time
+import asyncio
+import argparse
+from mcp.server.fastmcp import FastMCP
+
+# Stand-in MCP server for bench.py: tools sleep for a fixed latency and return payloads of a requested size.
+parser = argparse.ArgumentParser()
+parser.add_argument("--name", default="bench")
+parser.add_argument("--latency", type=float, default=0.02, help="seconds each tool call takes")
+parser.add_argument("--payload", type=int, default=256, help="default result size in bytes")
+parser.add_argument("--startup-delay", type=float, default=0.0, help="seconds to sleep before serving")
+args = parser.parse_args()
+
+time.sleep(args.startup_delay)
+mcp = FastMCP(args.name, log_level="WARNING")
+
+
+@mcp.tool()
+async def lookup(key: str) -> str:
+    """Look up a record by key."""
+    await asyncio.sleep(args.latency)
+    return f"{key}=" + "x" * args.payload
+
+
+@mcp.tool()
+async def fetch(url: str, size: int = 0) -> str:
+    """Fetch a document and return its body."""
+    await asyncio.sleep(args.latency)
+    return "y" * (size or args.payload)
+
+
+@mcp.tool()
+async def compute(expression: str) -> str:
+    """Evaluate an arithmetic expression."""
+    await asyncio.sleep(args.latency)
+    return f"{expression} = 42"
+
+
+if __name__ == "__main__":
+    mcp.run(transport='stdio')
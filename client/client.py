@@ -1,59 +1,183 @@
+import copy
 import time
+import argparse
 import os
 import sys
 import subprocess
 import asyncio
+import signal
+import uuid
+import contextlib
+import contextvars
+from functools import partial
 from typing import Optional
-from contextlib import AsyncExitStack
+from contextlib import AsyncExitStack, asynccontextmanager
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp import types as mcp_types
 from google import genai
 from google.genai import types
+from google.genai import errors as genai_errors
 from google.genai.types import Tool, FunctionDeclaration
 from google.genai.types import GenerateContentConfig
 from fastmcp import Client
 from dotenv import load_dotenv
+from line_reader import AsyncLineReader
+from batch import run_batch
+from tool_cache import ToolResultCache
+from lazy_server import LazyServer, ServerDisconnected, call_tool_cancellable
+from remote_server import is_connection_error, remote_transport
+from worker_pool import WorkerPool
+from tool_manifest import ToolManifestCache
+from tool_retrieval import ToolIndex, tool_document
+from context_cache import GeminiContextCache, is_cache_rejection
+from memory import Conversation, ConversationMemory, digest
+from session_store import SessionStore
+from tracing import Tracer, payload_size
 # from csm import generate_audio
 
 load_dotenv()
 
+DEFAULT_MANIFEST_DIR = os.path.expanduser("~/.cache/mcp-client/tool-manifests")
+DEFAULT_SESSION_DB = os.path.expanduser("~/.local/share/mcp-client/sessions.db")
+DEFAULT_TRACE_PATH = os.path.expanduser("~/.cache/mcp-client/traces.jsonl")
+
+# The conversation the current query belongs to, so concurrent queries keep separate state
+_active_conversation: contextvars.ContextVar[Optional[Conversation]] = contextvars.ContextVar(
+    "active_conversation", default=None
+)
+
 class MCPClient:
-    def __init__(self, history_length: int = 4):
+    def __init__(
+        self,
+        history_length: int = 4,
+        history_token_budget: int = 8000,
+        server_startup_timeout: float = 30.0,
+        max_concurrent_calls_per_server: int = 4,
+        model: str = 'gemini-2.5-flash',
+        llm_timeout: float = 60.0,
+        stream: bool = False,
+        tool_cache_size: int = 256,
+        tool_cache_ttl: float = 60.0,
+        lazy: bool = False,
+        server_idle_timeout: float = 300.0,
+        tool_manifest_dir: Optional[str] = DEFAULT_MANIFEST_DIR,
+        tool_top_k: Optional[int] = 12,
+        pinned_tool_count: int = 4,
+        context_cache: bool = False,
+        context_cache_ttl: int = 3600,
+        session_store_path: Optional[str] = DEFAULT_SESSION_DB,
+        session_id: Optional[str] = None,
+        trace_path: Optional[str] = DEFAULT_TRACE_PATH,
+        profile: bool = False,
+        genai_client: Optional[genai.Client] = None,
+        server_workers: Optional[dict[str, int]] = None,
+    ):
+        self.tracer = Tracer(trace_path, profile=profile)
         self.sessions: dict[str, ClientSession] = {}
+        self.degraded_servers: dict[str, str] = {}
+        self.server_ready_times: dict[str, float] = {}
+        self.server_startup_timeout = server_startup_timeout
+        self.lazy = lazy
+        self.server_idle_timeout = server_idle_timeout
+        # Servers behind an on-demand connection: lazy and remote servers and worker pools
+        self.lazy_servers: dict[str, LazyServer | WorkerPool] = {}
+        # server name -> worker process count for the default server configs
+        self.server_workers = server_workers or {}
+        self.server_tools: dict[str, list[mcp_types.Tool]] = {}
+        # server name -> converted Gemini declarations for that server's prefixed tools
+        self.server_declarations: dict[str, list[Tool]] = {}
+        self.tool_manifest = ToolManifestCache(tool_manifest_dir) if tool_manifest_dir else None
+        self._handshake_tasks: dict[str, asyncio.Task] = {}
+        # prefixed tool name -> (server name, original tool name)
+        self.tool_routes: dict[str, tuple[str, str]] = {}
+        self.function_declarations = []
+        self.tool_guide_lines: dict[str, str] = {}
+        self.declarations_by_name: dict[str, Tool] = {}
+        self.tool_guide = build_tool_guide([])
+        self.generate_config = types.GenerateContentConfig(tools=[])
+        self.tool_index = ToolIndex({})
+        self.tool_top_k = tool_top_k
+        self.pinned_tool_count = pinned_tool_count
+        self.tool_set_version = 0
+        self.max_concurrent_calls_per_server = max_concurrent_calls_per_server
+        self.server_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.server_configs: dict = {}
+        self.tool_cache = ToolResultCache(max_entries=tool_cache_size)
+        self.tool_cache_ttl = tool_cache_ttl
+        # (server name, original tool name) -> TTL for tools whose results may be cached
+        self.read_only_tool_ttls: dict[tuple[str, str], float] = {}
+        self._background_tasks: set[asyncio.Task] = set()
         self.exit_stack = AsyncExitStack()
         self.history_length = history_length
-        self.conversation_history = []
-        gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if not gemini_api_key:
-            raise ValueError("GEMINI_API_KEY not found. Please add it to your .env file.")
-        self.genai_client = genai.Client(api_key=gemini_api_key)
-        
-    def add_to_history(self, query: str, response: str):
-        """Add a query-response pair to conversation history."""
-        self.conversation_history.append({
-            "query": query,
-            "response": response,
-            "timestamp": time.time()
-        })
-        
-        # Keep only the last k interactions
-        if len(self.conversation_history) > self.history_length:
-            self.conversation_history = self.conversation_history[-self.history_length:]
-    
-    def get_history_context(self) -> str:
-        """Format conversation history for inclusion in the prompt."""
-        if not self.conversation_history:
-            return ""
-        
-        history_text = "\n\nPrevious conversation:\n"
-        for i, interaction in enumerate(self.conversation_history, 1):
-            history_text += f"Q{i}: {interaction['query']}\n"
-            history_text += f"A{i}: {interaction['response'][:200]}...\n"  # Truncate long responses
-        history_text += "\n"
-        
-        return history_text
+        if genai_client is None:
+            gemini_api_key = os.getenv("GEMINI_API_KEY")
+            if not gemini_api_key:
+                raise ValueError("GEMINI_API_KEY not found. Please add it to your .env file.")
+            genai_client = genai.Client(api_key=gemini_api_key)
+        self.genai_client = genai_client
+        self.model = model
+        self.llm_timeout = llm_timeout
+        self.stream = stream
+        self.history_token_budget = history_token_budget
+        self.session_store = SessionStore(session_store_path) if session_store_path else None
+        # The interactive conversation; batch queries get their own via new_conversation()
+        self.conversation = self.new_conversation(session_id, resume=bool(session_id))
+        self.memory = self.conversation.memory
+        self.session_id = self.conversation.session_id
+        self.context_cache = (
+            GeminiContextCache(self.genai_client, model, ttl_seconds=context_cache_ttl) if context_cache else None
+        )
         
-    async def connect_to_servers(self):
+    def new_conversation(self, session_id: Optional[str] = None, resume: bool = False) -> Conversation:
+        """Create conversation state that shares this client's servers but not its memory."""
+        session_id = session_id or uuid.uuid4().hex[:12]
+        memory = ConversationMemory(
+            token_budget=self.history_token_budget,
+            max_turns=self.history_length,
+            summarizer=self.summarize_turns,
+            on_compact=partial(self._record_summary, session_id),
+            on_clear=partial(self._record_clear, session_id),
+        )
+        if resume and self.session_store is not None:
+            # Loaded on the first query rather than here, so big histories don't slow startup
+            memory.restore_from(partial(self._load_session, session_id))
+        return Conversation(session_id=session_id, memory=memory)
+
+    async def _load_session(self, session_id: str):
+        snapshot = await asyncio.to_thread(self.session_store.load, session_id)
+        if snapshot is None:
+            print(f"No saved session '{session_id}', starting fresh.")
+            return None
+        print(f"Resumed session '{session_id}' ({snapshot.turn_count} turns).")
+        return snapshot.summary, snapshot.compacted_turns, snapshot.turns, snapshot.turn_count
+
+    def _record_summary(self, session_id: str, summary: str, compacted_turns: int):
+        if self.session_store is not None:
+            self.session_store.record(
+                session_id, "summary", {"summary": summary, "compacted_turns": compacted_turns}
+            )
+
+    def _record_clear(self, session_id: str):
+        if self.session_store is not None:
+            self.session_store.record(session_id, "clear", {})
+
+    async def summarize_turns(self, summary: str, contents: list[types.Content]) -> str:
+        """Fold evicted conversation turns into the running summary with Gemini."""
+        prompt = (
+            "Update the running summary of a conversation between a user and an assistant that uses tools. "
+            "Keep every fact, name, id, path and result the assistant may need later; drop pleasantries. "
+            "Reply with the updated summary only.\n\n"
+            f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n{digest(contents, limit=2000)}"
+        )
+        response = await asyncio.wait_for(
+            self.genai_client.aio.models.generate_content(model=self.model, contents=prompt),
+            timeout=self.llm_timeout,
+        )
+        return response.text or summary
+
+    def get_server_configs(self) -> dict:
+        """Build the default launch config for each MCP server."""
         google_client_id = os.getenv("GOOGLE_CLIENT_ID")
         google_client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
 
@@ -74,6 +198,14 @@ class MCPClient:
             "google-workspace-mcp:local"
         ]
 
+        # A config may add "read_only_tools": {"tool_name": ttl_seconds} to cache that tool's results.
+        # Tools annotated with readOnlyHint are cached with tool_cache_ttl.
+        # "lazy": True spawns a server only when its tools are used and shuts it down after "idle_timeout" seconds.
+        # "workers": N runs N processes behind the name, routing calls to the least busy one. Tools in
+        # "primary_tools" always run on the first worker; "replicated_tools" change state every worker
+        # must share, so they run on all of them.
+        # A config with "url" (and optionally "transport": "sse" and "headers") connects to an already
+        # running server instead of spawning one; MCP_<NAME>_URL overrides a default server with a URL.
         server_configs = {
             "googletool": {
                 "command": "docker", 
@@ -83,66 +215,602 @@ class MCPClient:
                     "GOOGLE_CLIENT_SECRET": google_client_secret,
                 }
             },
-            "terminal": {"command": "python3", "args": ["../server/terminal-server.py"]},
+            "terminal": {
+                "command": "python3",
+                "args": ["../server/terminal-server.py"],
+                "replicated_tools": ["change_workspace"],
+                # Shell sessions live in one process, so every call for them goes to the same worker;
+                # search stays on it too so one warm index serves every query
+                "primary_tools": ["open_shell", "shell_exec", "close_shell", "search"],
+            },
             "spotify": {"command": "python3", "args": ["../server/spotify-server.py"]},
             "system": {"command": "python3", "args": ["../server/system-server.py"]},
         }
+        for name, workers in self.server_workers.items():
+            if name in server_configs:
+                server_configs[name]["workers"] = workers
+        for name in server_configs:
+            url = os.getenv(f"MCP_{name.upper()}_URL")
+            if url:
+                server_configs[name] = {"url": url}
+        return server_configs
 
-        all_tools = []
+    async def connect_to_servers(self, server_configs: Optional[dict] = None):
+        with self.tracer.span("startup"):
+            await self._connect_to_servers(server_configs)
+
+    async def _connect_to_servers(self, server_configs: Optional[dict]):
+        if server_configs is None:
+            server_configs = self.get_server_configs()
+        self.server_configs = server_configs
+
+        # Spawn every server up front so their cold starts overlap.
+        # Transports are entered from this task so the shared exit stack can close them.
+        pending = {}
         for name, config in server_configs.items():
-            print(f"Starting and connecting to {name} server...")
+            started_at = time.perf_counter()
+            cached = self.tool_manifest.load(name, config) if self.tool_manifest else None
+            if cached is not None:
+                self.server_tools[name], self.server_declarations[name] = cached
+                print(f"Loaded {name} tools from manifest cache.")
+
+            if "url" in config:
+                # Shared, already-running server: connection is owned by a task and reopened if it drops
+                self.lazy_servers[name] = LazyServer(
+                    name,
+                    remote_transport(config, max_connections=self.max_concurrent_calls_per_server),
+                    idle_timeout=config.get("idle_timeout"),
+                    startup_timeout=self.server_startup_timeout,
+                    message_handler=self._make_message_handler(name),
+                    remote=True,
+                )
+                if cached is None:
+                    pending[name] = self._initialize_server(name, started_at)
+                else:
+                    self._handshake_tasks[name] = self._start_handshake(name, started_at)
+                continue
+
             server_params = StdioServerParameters(
                 command=config["command"], 
                 args=config["args"],
                 env=config.get("env")
             )
-            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-            
-            session = await self.exit_stack.enter_async_context(ClientSession(*stdio_transport))
-            await session.initialize()
-            
+            if config.get("workers", 1) > 1:
+                # Several processes behind one name; workers beyond the primary start in the background
+                pool = WorkerPool(
+                    name,
+                    partial(stdio_client, server_params),
+                    workers=config["workers"],
+                    idle_timeout=config.get("idle_timeout", self.server_idle_timeout),
+                    startup_timeout=self.server_startup_timeout,
+                    message_handler=self._make_message_handler(name),
+                    primary_tools=config.get("primary_tools"),
+                    replicated_tools=config.get("replicated_tools"),
+                )
+                self.lazy_servers[name] = pool
+                task = asyncio.create_task(pool.start())
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+                if cached is None:
+                    pending[name] = self._initialize_server(name, started_at)
+                else:
+                    self._handshake_tasks[name] = self._start_handshake(name, started_at)
+                continue
+
+            if self.lazy or config.get("lazy"):
+                # Spawned on first use and reaped once idle
+                self.lazy_servers[name] = LazyServer(
+                    name,
+                    partial(stdio_client, server_params),
+                    idle_timeout=config.get("idle_timeout", self.server_idle_timeout),
+                    startup_timeout=self.server_startup_timeout,
+                    message_handler=self._make_message_handler(name),
+                    # Cached tools are checked against the real ones when it first spawns
+                    on_connect=partial(self._verify_manifest, name) if cached is not None else None,
+                )
+                if cached is None:
+                    # Nothing cached, so spawn it now to list its tools
+                    pending[name] = self._initialize_server(name, started_at)
+                continue
+
+            print(f"Starting {name} server...")
+            try:
+                stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
+                session = await self.exit_stack.enter_async_context(
+                    ClientSession(*stdio_transport, message_handler=self._make_message_handler(name))
+                )
+            except Exception as e:
+                self.degraded_servers[name] = str(e)
+                self.server_tools.pop(name, None)
+                self.server_declarations.pop(name, None)
+                print(f"⚠️  Failed to start {name} server: {e}")
+                continue
+            if cached is not None:
+                # Advertise the cached tools now; calls wait for the handshake in open_session
+                self._handshake_tasks[name] = self._start_handshake(name, started_at, session)
+            else:
+                pending[name] = self._initialize_server(name, started_at, session)
+
+        # Handshake with all uncached servers in parallel
+        results = await asyncio.gather(*pending.values())
+        for name, tools in zip(pending, results):
+            if tools is not None:
+                self.server_tools[name] = tools
+        # Keep tools in config order so the routing table is stable across runs
+        self.server_tools = {name: self.server_tools[name] for name in server_configs if name in self.server_tools}
+
+        if self.server_ready_times:
+            print("\nServer readiness times:")
+            for name, elapsed in sorted(self.server_ready_times.items(), key=lambda item: item[1], reverse=True):
+                print(f"  {name}: {elapsed:.2f}s")
+        if self.degraded_servers:
+            print("Degraded servers:", ", ".join(self.degraded_servers))
+
+        self._rebuild_tool_index()
+        for name, tools in zip(pending, results):
+            if tools is not None:
+                self._save_tool_manifest(name)
+        print("\nConnected to all servers with tools:", [
+            func.name for tool in self.function_declarations for func in tool.function_declarations
+        ])
+
+    def _start_handshake(self, name: str, started_at: float, session: Optional[ClientSession] = None) -> asyncio.Task:
+        # A fresh context makes the handshake its own trace; otherwise its span would attach to
+        # the startup span, which has usually finished and been written by the time it ends
+        return asyncio.create_task(self._finish_handshake(name, started_at, session), context=contextvars.Context())
+
+    async def _finish_handshake(self, name: str, started_at: float, session: Optional[ClientSession] = None):
+        """Complete a server's handshake in the background and reconcile it with its cached tools."""
+        tools = await self._initialize_server(name, started_at, session)
+        if tools is None:
+            # The server never came up, so stop advertising its cached tools
+            self.server_tools.pop(name, None)
+            self.server_declarations.pop(name, None)
+            self._rebuild_tool_index()
+            return
+        self._reconcile_tools(name, tools)
+
+    async def _verify_manifest(self, name: str, session: ClientSession):
+        """On a lazy server's first spawn, list its tools and reconcile them with its cached manifest."""
+        lazy_server = self.lazy_servers[name]
+        try:
+            response = await asyncio.wait_for(session.list_tools(), timeout=self.server_startup_timeout)
+        except Exception as e:
+            # Tried again on the next spawn; the cached tools stay advertised meanwhile
+            print(f"⚠️  Could not list {name} tools to check the manifest cache: {e}")
+            return
+        lazy_server.on_connect = None
+        self._reconcile_tools(name, response.tools)
+
+    def _reconcile_tools(self, name: str, tools: list):
+        """Replace a server's cached tools with the ones it actually lists, if they differ."""
+        cached_tools = self.server_tools.get(name, [])
+        if [tool.model_dump(exclude_none=True) for tool in tools] != [
+            tool.model_dump(exclude_none=True) for tool in cached_tools
+        ]:
+            print(f"\n🔄 {name} tools differ from the manifest cache, updating.")
+            self.server_tools[name] = tools
+            self.server_declarations.pop(name, None)
+            self._rebuild_tool_index()
+            self._save_tool_manifest(name)
+
+    def _save_tool_manifest(self, name: str):
+        if self.tool_manifest and name in self.server_declarations:
+            self.tool_manifest.save(
+                name, self.server_configs[name], self.server_tools[name], self.server_declarations[name]
+            )
+
+    async def _initialize_server(self, name: str, started_at: float, session: Optional[ClientSession] = None):
+        """Initialize one server session and list its tools, or mark it degraded."""
+        with self.tracer.span("server.handshake", server=name, lazy=name in self.lazy_servers) as span:
+            tools = await self._handshake(name, session)
+            span.set(tools=len(tools) if tools is not None else None)
+        if tools is not None:
+            self.server_ready_times[name] = time.perf_counter() - started_at
+        return tools
+
+    async def _handshake(self, name: str, session: Optional[ClientSession]):
+        try:
+            if name in self.lazy_servers:
+                async with self.lazy_servers[name].acquire() as lazy_session:
+                    response = await asyncio.wait_for(lazy_session.list_tools(), timeout=self.server_startup_timeout)
+            else:
+                await asyncio.wait_for(session.initialize(), timeout=self.server_startup_timeout)
+                response = await asyncio.wait_for(session.list_tools(), timeout=self.server_startup_timeout)
+        except asyncio.TimeoutError:
+            self.degraded_servers[name] = f"timed out after {self.server_startup_timeout}s"
+            print(f"⚠️  {name} server timed out during startup, marking as degraded.")
+            return None
+        except Exception as e:
+            self.degraded_servers[name] = str(e)
+            print(f"⚠️  {name} server failed during startup: {e}")
+            return None
+
+        if session is not None:
             self.sessions[name] = session
-            
-            response = await session.list_tools()
-            
-            # Add prefix to tool names
-            for tool in response.tools:
-                tool.name = f"{name}_" + tool.name
-            
-            all_tools.extend(response.tools)
-            print(f"Connected to {name} server.")
+        print(f"Connected to {name} server.")
+        return response.tools
 
-        print("\nConnected to all servers with tools:", [tool.name for tool in all_tools])
-        self.function_declarations = convert_mcp_tools_to_gemini(all_tools)
-        
-    async def process_query(self, query: str) -> str:
-        # tool/argument guide for Gemini
-        tool_guide = "Available tools and their arguments:\n"
-        for tool in self.function_declarations:
-            for func in tool.function_declarations:
-                if hasattr(func.parameters, 'model_dump'):
-                    params_dict = func.parameters.model_dump()
-                elif hasattr(func.parameters, 'dict'):
-                    params_dict = func.parameters.dict()
-                else:
-                    params_dict = dict(func.parameters)
-                params = params_dict.get('properties', {})
-                param_list = ', '.join([f"'{k}'" for k in params.keys()])
-                tool_guide += f"- {func.name}({param_list})\n"
+    def _rebuild_tool_index(self):
+        """Rebuild the tool routing table and Gemini declarations from server_tools."""
+        with self.tracer.span("tools.index", servers=len(self.server_tools)):
+            self._build_tool_index()
+
+    def _build_tool_index(self):
+        routes = {}
+        all_tools = []
+        function_declarations = []
+        read_only_ttls = {}
+        index_documents = {}
+        for server_name, tools in self.server_tools.items():
+            server_tools = []
+            configured_ttls = self.server_configs.get(server_name, {}).get("read_only_tools", {})
+            for tool in tools:
+                # Only tools explicitly marked read-only (config or MCP annotations) are cacheable
+                if tool.name in configured_ttls:
+                    read_only_ttls[(server_name, tool.name)] = configured_ttls[tool.name]
+                elif tool.annotations and tool.annotations.readOnlyHint:
+                    read_only_ttls[(server_name, tool.name)] = self.tool_cache_ttl
+
+                # Add prefix to tool names
+                prefixed_name = f"{server_name}_{tool.name}"
+                if prefixed_name in routes:
+                    other_server, other_tool = routes[prefixed_name]
+                    raise ValueError(
+                        f"Ambiguous tool name '{prefixed_name}': provided by both "
+                        f"'{other_server}' ({other_tool}) and '{server_name}' ({tool.name})"
+                    )
+                routes[prefixed_name] = (server_name, tool.name)
+                index_documents[prefixed_name] = tool_document(server_name, tool)
+                server_tools.append(tool.model_copy(update={"name": prefixed_name}))
+            all_tools.extend(server_tools)
+
+            # Only convert servers whose tools changed since the last rebuild
+            declarations = self.server_declarations.get(server_name)
+            if declarations is None:
+                declarations = convert_mcp_tools_to_gemini(server_tools)
+                self.server_declarations[server_name] = declarations
+            function_declarations.extend(declarations)
+
+        # Gemini sometimes drops the server prefix, so also route bare names that are unambiguous
+        bare_names = {}
+        for server_name, tools in self.server_tools.items():
+            for tool in tools:
+                bare_names.setdefault(tool.name, []).append(server_name)
+        for tool_name, servers in bare_names.items():
+            if len(servers) == 1 and tool_name not in routes:
+                routes[tool_name] = (servers[0], tool_name)
+
+        self.tool_routes = routes
+        self.read_only_tool_ttls = read_only_ttls
+        self.function_declarations = function_declarations
+
+        # Compile the prompt pieces once per tool-set version instead of on every query
+        self.tool_guide_lines = {tool.name: tool_guide_line(tool) for tool in all_tools}
+        self.declarations_by_name = {
+            func.name: tool for tool in function_declarations for func in tool.function_declarations
+        }
+        self.tool_guide = build_tool_guide(self.tool_guide_lines.values())
+        self.generate_config = types.GenerateContentConfig(
+            tools=self.function_declarations,
+        )
+        self.tool_index = ToolIndex(index_documents)
+        self.tool_set_version += 1
+
+    def select_tools(self, query: str) -> Optional[list[str]]:
+        """Pick the prefixed tools to offer Gemini for a query, or None to offer all of them."""
+        if self.tool_top_k is None or len(self.declarations_by_name) <= self.tool_top_k:
+            return None
+        matches = self.tool_index.search(query, self.tool_top_k)
+        if not matches:
+            # Nothing in the query matched any tool, so don't risk hiding the one it needs
+            return None
+        # Tools used recently in the conversation stay available for follow-ups like "do that again"
+        recent_tools = (_active_conversation.get() or self.conversation).recent_tools
+        pinned = [name for name in reversed(recent_tools) if name in self.declarations_by_name]
+        return list(dict.fromkeys(matches + pinned))
+
+    def tool_prompt(self, selected_tools: Optional[list[str]]):
+        """Return the tool guide and generation config for a tool selection."""
+        if selected_tools is None:
+            return self.tool_guide, self.generate_config
+        tool_guide = build_tool_guide(self.tool_guide_lines[name] for name in selected_tools)
+        generate_config = types.GenerateContentConfig(
+            tools=[self.declarations_by_name[name] for name in selected_tools],
+        )
+        return tool_guide, generate_config
+
+    def _make_message_handler(self, server_name: str):
+        """Build a ClientSession message handler that watches for tools/list_changed."""
+        async def handle_message(message):
+            if isinstance(message, mcp_types.ServerNotification) and isinstance(
+                message.root, mcp_types.ToolListChangedNotification
+            ):
+                # Can't await list_tools() here: this runs inside the session's receive loop
+                task = asyncio.create_task(self._refresh_server_tools(server_name))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+        return handle_message
+
+    async def _refresh_server_tools(self, server_name: str):
+        """Re-list one server's tools after it reports tools/list_changed."""
+        if server_name not in self.sessions and server_name not in self.lazy_servers:
+            return
+        previous_tools = self.server_tools.get(server_name, [])
+        try:
+            async with self.open_session(server_name) as session:
+                response = await session.list_tools()
+            self.server_tools[server_name] = response.tools
+            self.server_declarations.pop(server_name, None)
+            self._rebuild_tool_index()
+            self._save_tool_manifest(server_name)
+            self.tool_cache.invalidate_server(server_name)
+            print(f"\n🔄 Tool list changed on {server_name} server: {[tool.name for tool in response.tools]}")
+        except Exception as e:
+            self.server_tools[server_name] = previous_tools
+            self._rebuild_tool_index()
+            print(f"\n⚠️  Ignoring tool list change on {server_name} server: {e}")
         
-        tool_guide += "\nUse these tools to answer the query. If a tool is needed, call it with the required parameters.\n If an error occurs, provide the error message and a traceback. \n\n"
+    @asynccontextmanager
+    async def open_session(self, server_name: str):
+        """Yield the session for a server, spawning it first if it is lazy and not running."""
+        lazy_server = self.lazy_servers.get(server_name)
+        if lazy_server is None:
+            handshake = self._handshake_tasks.get(server_name)
+            if handshake is not None:
+                # Tools were served from the manifest cache; wait for the server to actually be ready
+                await asyncio.shield(handshake)
+            if server_name not in self.sessions:
+                raise RuntimeError(
+                    f"{server_name} server is unavailable: {self.degraded_servers.get(server_name, 'not connected')}"
+                )
+            yield self.sessions[server_name]
+            return
+        async with lazy_server.acquire() as session:
+            yield session
+
+    async def generate(
+        self, contents: list, config: Optional[types.GenerateContentConfig] = None
+    ) -> types.GenerateContentResponse:
+        """Call Gemini on the async client so the event loop keeps running, bounded by llm_timeout."""
+        with self.tracer.span("llm.generate", model=self.model, contents=len(contents)) as span:
+            response = await asyncio.wait_for(
+                self.genai_client.aio.models.generate_content(
+                    model=self.model,
+                    contents=contents,
+                    config=config or self.generate_config,
+                ),
+                timeout=self.llm_timeout,
+            )
+            span.set(**usage_attrs(response))
+        return response
+
+    async def run_turn(self, contents: list, config: types.GenerateContentConfig, run_tools: bool = True):
+        """Run one Gemini turn and its tool calls; returns the call parts, text and responses in call order."""
+        if self.stream:
+            return await self.stream_turn(contents, config, run_tools=run_tools)
+        response = await self.generate(contents, config)
+        function_call_parts, final_text = split_response_parts(response)
+        if not run_tools:
+            return [], final_text, []
+
+        # Run every call from this turn concurrently, then record them in the order Gemini made them
+        function_responses = await asyncio.gather(
+            *(self.execute_tool_call(part.function_call) for part in function_call_parts)
+        )
+        return function_call_parts, final_text, function_responses
+
+    async def run_turn_with_fallback(self, contents: list, config: types.GenerateContentConfig, run_tools: bool = True):
+        """Run a turn, resending the tool prefix inline if Gemini rejects the cached content.
+
+        Returns the turn and the config to use for the rest of the query.
+        """
+        try:
+            return await self.run_turn(contents, config, run_tools=run_tools), config
+        except genai_errors.APIError as e:
+            if not config.cached_content or not is_cache_rejection(e):
+                raise
+            print(f"⚠️  Gemini rejected the cached tool prefix ({e}), sending tools inline.")
+            await self.context_cache.reject(self.tool_set_version)
+            contents.insert(0, types.Content(role='user', parts=[types.Part.from_text(text=self.tool_guide)]))
+            return await self.run_turn(contents, self.generate_config, run_tools=run_tools), self.generate_config
+
+    async def stream_turn(
+        self, contents: list, config: Optional[types.GenerateContentConfig] = None, run_tools: bool = True
+    ):
+        """Stream one Gemini turn, echoing text as it arrives and starting tool calls as soon as they appear.
+
+        Returns the function call parts, the turn's text and the function responses in call order.
+        """
+        function_call_parts = []
+        tool_tasks = []
+        text_chunks = []
+        # Tool calls start while the stream is still open, but are traced under the turn, not the LLM call
+        turn_context = contextvars.copy_context()
+        try:
+            with self.tracer.span("llm.stream", model=self.model, contents=len(contents)) as span:
+                async with asyncio.timeout(self.llm_timeout):
+                    stream = await self.genai_client.aio.models.generate_content_stream(
+                        model=self.model,
+                        contents=contents,
+                        config=config or self.generate_config,
+                    )
+                    async for chunk in stream:
+                        if chunk.usage_metadata:
+                            span.set(**usage_attrs(chunk))
+                        chunk_calls, chunk_text = split_response_parts(chunk)
+                        for text in chunk_text:
+                            text_chunks.append(text)
+                            sys.stdout.write(text)
+                            sys.stdout.flush()
+                        if run_tools:
+                            for part in chunk_calls:
+                                function_call_parts.append(part)
+                                tool_tasks.append(asyncio.create_task(
+                                    self.execute_tool_call(part.function_call), context=turn_context.copy()
+                                ))
+            function_responses = await asyncio.gather(*tool_tasks)
+        except BaseException:
+            for task in tool_tasks:
+                task.cancel()
+            raise
+        if text_chunks:
+            sys.stdout.write("\n")
+        final_text = ["".join(text_chunks)] if text_chunks else []
+        return function_call_parts, final_text, function_responses
+
+    async def execute_tool_call(self, function_call: types.FunctionCall) -> dict:
+        """Dispatch one Gemini function call to its server and return the function response."""
+        # Find the correct session and tool name
+        full_tool_name = function_call.name
+        route = self.tool_routes.get(full_tool_name)
+        if route is None:
+            raise ValueError(f"No server session found for tool call '{full_tool_name}'")
+        server_name, tool_name = route
+        tool_args = function_call.args
+
+        conversation = _active_conversation.get() or self.conversation
+        # Keep recently used tools pinned into this conversation's future retrieval results
+        prefixed_name = f"{server_name}_{tool_name}"
+        conversation.recent_tools[prefixed_name] = None
+        conversation.recent_tools.move_to_end(prefixed_name)
+        while len(conversation.recent_tools) > self.pinned_tool_count:
+            conversation.recent_tools.popitem(last=False)
+
+        print(f"\n[Gemini requested tool call on '{server_name}': {tool_name} with args {tool_args}]")
+        turn_index = conversation.memory.turn_count
+        if self.session_store is not None:
+            self.session_store.record(
+                conversation.session_id,
+                "tool_call",
+                {"server": server_name, "tool": tool_name, "args": tool_args},
+                turn_index=turn_index,
+            )
+        started_at = time.perf_counter()
+        with self.tracer.span(
+            "tool", server=server_name, tool=tool_name, args_bytes=payload_size(tool_args or {})
+        ) as span:
+            function_response = await self._call_tool(server_name, tool_name, tool_args)
+            span.set(result_bytes=payload_size(function_response), failed="error" in function_response)
+        if self.session_store is not None:
+            self.session_store.record(
+                conversation.session_id,
+                "tool_result",
+                {"server": server_name, "tool": tool_name, **function_response},
+                turn_index=turn_index,
+                duration=time.perf_counter() - started_at,
+            )
+        return function_response
+
+    async def _call_tool(self, server_name: str, tool_name: str, tool_args: Optional[dict]) -> dict:
+        """Call a tool on its server through the result cache and the per-server concurrency limit."""
+        full_tool_name = f"{server_name}_{tool_name}"
+        semaphore = self.server_semaphores.get(server_name)
+        if semaphore is None:
+            workers = self.server_configs.get(server_name, {}).get("workers", 1)
+            semaphore = asyncio.Semaphore(self.max_concurrent_calls_per_server * workers)
+            self.server_semaphores[server_name] = semaphore
+
+        cache_ttl = self.read_only_tool_ttls.get((server_name, tool_name))
+        if cache_ttl is not None:
+            cache_key = ToolResultCache.make_key(server_name, tool_name, tool_args)
+            generation = self.tool_cache.generation(server_name)
+            cached_content = self.tool_cache.get(cache_key)
+            if cached_content is not None:
+                print(f"⚡ Tool result served from cache: {full_tool_name}")
+                return {"result": cached_content}
+        else:
+            # A side-effecting call may change what this server's read-only tools return
+            self.tool_cache.invalidate_server(server_name)
+
+        # Cap in-flight calls per server so one slow server can't hog the turn
+        async with semaphore:
+            try:
+                result = await self._call_server_tool(server_name, tool_name, tool_args)
+                function_response = {"result": result.content}
+                print(f"✅ Tool call successful: {full_tool_name}")
+            except Exception as e:
+                function_response = {"error": str(e)}
+                print(f"❌ Tool call failed: {full_tool_name}: {str(e)}")
+                return function_response
+            finally:
+                if cache_ttl is None:
+                    # Again afterwards: a concurrent read may have cached what it saw before this call finished
+                    self.tool_cache.invalidate_server(server_name)
+
+        # Unless a side-effecting call started or finished meanwhile, which may make this result stale
+        if cache_ttl is not None and not result.isError and self.tool_cache.generation(server_name) == generation:
+            self.tool_cache.put(cache_key, result.content, cache_ttl)
+        return function_response
+
+    async def _call_server_tool(self, server_name: str, tool_name: str, tool_args: Optional[dict]):
+        """Call a tool on its server; a dropped remote connection is reopened and the call retried once.
+
+        A call is only retried when it never reached the server or the tool is read-only, since
+        a side-effecting call may already have run before the connection dropped.
+        """
+        lazy_server = self.lazy_servers.get(server_name)
+        progress_callback = partial(show_tool_progress, f"{server_name}_{tool_name}")
+        if lazy_server is None:
+            async with self.open_session(server_name) as session:
+                return await call_tool_cancellable(session, tool_name, tool_args, progress_callback)
+        read_only = (server_name, tool_name) in self.read_only_tool_ttls
+        try:
+            return await lazy_server.call_tool(tool_name, tool_args, progress_callback)
+        except ServerDisconnected as e:
+            if not lazy_server.remote:
+                raise
+            sent = e.sent
+        except Exception as e:
+            if not (lazy_server.remote and is_connection_error(e)):
+                raise
+            await lazy_server.reset()
+            sent = True
+        if sent and not read_only:
+            raise ConnectionError(
+                f"lost connection to {server_name} server during {tool_name}; it may or may not have run,"
+                " so it wasn't retried"
+            )
+        print(f"🔌 Reconnecting to {server_name} server...")
+        return await lazy_server.call_tool(tool_name, tool_args, progress_callback)
+
+    async def process_query(self, query: str, conversation: Optional[Conversation] = None) -> str:
+        conversation = conversation or self.conversation
+        token = _active_conversation.set(conversation)
+        try:
+            with self.tracer.span("query", query_chars=len(query)):
+                return await self._process_query(query, conversation)
+        finally:
+            _active_conversation.reset(token)
 
-        # Include conversation history in the prompt
-        history_context = self.get_history_context()
-        full_prompt = tool_guide + history_context + query
+    async def _process_query(self, query: str, conversation: Conversation) -> str:
+        started_at = time.perf_counter()
+        if self.context_cache is not None:
+            # Reference the cached tool prefix instead of resending it; falls back to inline if unavailable
+            selected_tools = None
+            cached_content = await self.context_cache.get(
+                self.tool_set_version, self.tool_guide, self.function_declarations
+            )
+        else:
+            # Only offer Gemini the tools relevant to this query
+            selected_tools = self.select_tools(query)
+            if selected_tools is not None:
+                print(f"🔍 Offering {len(selected_tools)}/{len(self.declarations_by_name)} tools: {selected_tools}")
+            cached_content = None
+        if cached_content:
+            tool_guide = ""
+            generate_config = types.GenerateContentConfig(cached_content=cached_content)
+        else:
+            tool_guide, generate_config = self.tool_prompt(selected_tools)
 
         user_prompt_content = types.Content(
             role='user',
-            parts=[types.Part.from_text(text=full_prompt)]
+            parts=[types.Part.from_text(text=tool_guide + query)]
         )
         
-        # Initialize conversation contents with user prompt
-        conversation_contents = [user_prompt_content]
+        # Initialize conversation contents with the remembered turns and the user prompt
+        conversation_contents = await conversation.memory.context()
+        conversation_contents.append(user_prompt_content)
         max_iterations = 3
         iteration = 0
         
@@ -151,88 +819,35 @@ class MCPClient:
             print(f"\n🔄 Multi-step reasoning iteration {iteration}/{max_iterations}")
             
             # Generate response with current conversation context
-            response = self.genai_client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=conversation_contents,
-                config=types.GenerateContentConfig(
-                    tools=self.function_declarations,
-                ),
-            )
-            
-            # Check if response has function calls
-            has_function_call = False
-            final_text = []
-            
-            for candidate in response.candidates:
-                if candidate.content.parts:
-                    for part in candidate.content.parts:
-                        if isinstance(part, types.Part):
-                            if part.function_call:
-                                has_function_call = True
-                                function_call_part = part
-                                
-                                # Find the correct session and tool name
-                                full_tool_name = function_call_part.function_call.name
-                                session = None
-                                server_name = None
-                                original_tool_name = None
-
-                                for s_name in self.sessions.keys():
-                                    prefix = f"{s_name}_"
-                                    if full_tool_name.startswith(prefix):
-                                        session = self.sessions[s_name]
-                                        server_name = s_name
-                                        original_tool_name = full_tool_name[len(prefix):]
-                                        break
-                                
-                                # If exact prefix match fails, search all func.name values
-                                if not session:
-                                    for s_name, sess in self.sessions.items():
-                                        for tool in self.function_declarations:
-                                            for func in tool.function_declarations:
-                                                if func.name.endswith(full_tool_name):
-                                                    session = sess
-                                                    server_name = s_name
-                                                    original_tool_name = full_tool_name
-                                                    break
-                                            if session:
-                                                break
-                                        if session:
-                                            break
-                                
-                                if not session:
-                                    raise ValueError(f"No server session found for tool call '{full_tool_name}'")
-
-                                tool_name = original_tool_name
-                                tool_args = function_call_part.function_call.args
-                                
-                                print(f"\n[Gemini requested tool call on '{server_name}': {tool_name} with args {tool_args}]")
-                                try:
-                                    result = await session.call_tool(tool_name, tool_args)
-                                    function_response = {"result": result.content}
-                                    print(f"✅ Tool call successful")
-                                except Exception as e:
-                                    function_response = {"error": str(e)}
-                                    print(f"❌ Tool call failed: {str(e)}")
-
-                                # Create function response content
-                                function_response_part = types.Part.from_function_response(
-                                    name=function_call_part.function_call.name,
-                                    response=function_response
-                                )
-                                function_response_content = types.Content(
-                                    role='tool',
-                                    parts=[function_response_part]
-                                )
-                                
-                                # Add both function call and response to conversation
-                                conversation_contents.append(function_call_part)
-                                conversation_contents.append(function_response_content)
-                                
-                            else:
-                                # This is text content, not a function call
-                                if part.text:
-                                    final_text.append(part.text)
+            with self.tracer.span("iteration", iteration=iteration):
+                (function_call_parts, final_text, function_responses), generate_config = await self.run_turn_with_fallback(
+                    conversation_contents, generate_config
+                )
+
+            has_function_call = bool(function_call_parts)
+
+            # Recall fallback: the model wanted a tool retrieval filtered out, so offer everything from now on
+            if selected_tools is not None and any(
+                part.function_call.name not in selected_tools for part in function_call_parts
+            ):
+                print("🔍 Gemini asked for a tool outside the retrieved set, widening to all tools.")
+                selected_tools = None
+                generate_config = self.generate_config
+
+            for function_call_part, function_response in zip(function_call_parts, function_responses):
+                # Create function response content
+                function_response_part = types.Part.from_function_response(
+                    name=function_call_part.function_call.name,
+                    response=function_response
+                )
+                function_response_content = types.Content(
+                    role='tool',
+                    parts=[function_response_part]
+                )
+                
+                # Add both function call and response to conversation
+                conversation_contents.append(types.Content(role='model', parts=[function_call_part]))
+                conversation_contents.append(function_response_content)
             
             # If no function call was made, break the loop
             if not has_function_call:
@@ -241,60 +856,179 @@ class MCPClient:
             else:
                 print(f"🔄 Tool call completed, checking if more are needed...")
         
-        # If we reached max iterations, get the final response
-        if iteration >= max_iterations:
+        # If we ran out of iterations with tool calls still pending, get the final response
+        if has_function_call:
             print(f"⚠️  Reached maximum iterations ({max_iterations}), getting final response...")
-            final_response = self.genai_client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=conversation_contents,
-                config=types.GenerateContentConfig(
-                    tools=self.function_declarations,
-                ),
-            )
-            
-            final_text = []
-            for candidate in final_response.candidates:
-                if candidate.content.parts:
-                    for part in candidate.content.parts:
-                        if isinstance(part, types.Part) and part.text:
-                            final_text.append(part.text)
+            with self.tracer.span("iteration", iteration="final"):
+                (_, final_text, _), generate_config = await self.run_turn_with_fallback(
+                    conversation_contents, generate_config, run_tools=False
+                )
         
         final_response = "\n".join(final_text)
         
-        # Add to conversation history
-        self.add_to_history(query, final_response)
+        # Remember this turn natively: the bare query (no tool guide), its tool calls and results, and the answer
+        prompt_index = next(i for i, content in enumerate(conversation_contents) if content is user_prompt_content)
+        turn_contents = [types.Content(role='user', parts=[types.Part.from_text(text=query)])]
+        turn_contents.extend(conversation_contents[prompt_index + 1:])
+        if final_response:
+            turn_contents.append(types.Content(role='model', parts=[types.Part.from_text(text=final_response)]))
+        if self.session_store is not None:
+            self.session_store.record_turn(
+                conversation.session_id,
+                conversation.memory.turn_count,
+                turn_contents,
+                time.perf_counter() - started_at,
+            )
+        conversation.memory.add_turn(turn_contents)
         
         return final_response
 
     async def chat_loop(self):
         print(f"\nMCP Client Started! Type 'quit' to exit.")
-        print(f"Conversation history length: {self.history_length} interactions")
+        print(
+            f"Conversation memory: last {self.history_length} interactions within "
+            f"~{self.memory.token_budget} tokens, older ones summarized"
+        )
+        if self.session_store is not None:
+            print(f"Session id: {self.session_id} (resume with --session {self.session_id})")
+        # Read stdin off the event loop so sessions keep draining while the user types
+        reader = AsyncLineReader()
+        reader.start()
         while True:
-            query = input("\nQuery: ").strip()
+            if reader.pending():
+                line = await reader.readline()
+                if line is not None:
+                    print(f"\nQuery (queued): {line}")
+            else:
+                print("\nQuery: ", end="", flush=True)
+                line = await reader.readline()
+            if line is None:
+                break
+            query = line.strip()
+            if not query:
+                continue
             if query.lower() == 'quit':
                 break
-            response = await self.process_query(query)
-            print("\n" + response)
+            try:
+                response = await self.run_cancellable(self.process_query(query))
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    # The client itself is shutting down, not just this query
+                    raise
+                print("\n⏹️  Query cancelled.")
+                continue
+            except asyncio.TimeoutError:
+                print(f"\n❌ Gemini did not respond within {self.llm_timeout}s.")
+                continue
+            if not self.stream:
+                # Streaming mode has already written the answer as it arrived
+                print("\n" + response)
+
+    async def run_cancellable(self, coro):
+        """Run coro as a task that Ctrl-C cancels, instead of tearing down the whole client."""
+        loop = asyncio.get_running_loop()
+        task = asyncio.create_task(coro)
+        try:
+            loop.add_signal_handler(signal.SIGINT, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            # Signal handlers aren't available on this platform/loop; Ctrl-C keeps its default behaviour
+            return await task
+        try:
+            return await task
+        finally:
+            loop.remove_signal_handler(signal.SIGINT)
 
     async def cleanup(self):
+        if self.session_store is not None:
+            await asyncio.to_thread(self.session_store.close)
+        if self.context_cache is not None:
+            await self.context_cache.close()
+        for handshake in self._handshake_tasks.values():
+            handshake.cancel()
+        await asyncio.gather(*self._handshake_tasks.values(), return_exceptions=True)
+        for lazy_server in self.lazy_servers.values():
+            await lazy_server.close()
+        stats = self.tool_cache.stats()
+        if stats["hits"] or stats["misses"]:
+            print(f"Tool cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
         await self.exit_stack.aclose()
+        # Last, so spans that end while shutting down are still written
+        self.tracer.close()
+
+async def show_tool_progress(full_tool_name: str, progress: float, total: Optional[float], message: Optional[str]):
+    """Echo the tail of output a tool streams as progress notifications, e.g. a long-running terminal command."""
+    if message:
+        for line in message.rstrip("\n").splitlines()[-5:]:
+            print(f"   │ {full_tool_name}: {line}")
+
+def usage_attrs(response) -> dict:
+    """Token counts from a Gemini response's usage metadata, for tracing."""
+    usage = response.usage_metadata
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": usage.prompt_token_count,
+        "output_tokens": usage.candidates_token_count,
+        "cached_tokens": usage.cached_content_token_count,
+        "total_tokens": usage.total_token_count,
+    }
 
-def clean_schema(schema):
+def split_response_parts(response):
+    """Split a Gemini response into its function call parts and text pieces."""
+    function_call_parts = []
+    final_text = []
+    for candidate in response.candidates or []:
+        if candidate.content and candidate.content.parts:
+            for part in candidate.content.parts:
+                if isinstance(part, types.Part):
+                    if part.function_call:
+                        function_call_parts.append(part)
+                    elif part.text:
+                        # This is text content, not a function call
+                        final_text.append(part.text)
+    return function_call_parts, final_text
+
+def clean_schema(schema, defs=None, expanding=frozenset()):
     if isinstance(schema, dict):
+        if defs is None:
+            defs = schema.get("$defs", {})
+        if "$ref" in schema:
+            # Inline models referenced as "#/$defs/Name", e.g. list items; Gemini schemas have no references
+            name = schema["$ref"].rsplit("/", 1)[-1]
+            target = defs.get(name)
+            # A self-referential model (e.g. a tree node) is inlined once; the inner reference is dropped
+            if isinstance(target, dict) and name not in expanding:
+                return clean_schema(copy.deepcopy(target), defs, expanding | {name})
         if 'oneOf' in schema and isinstance(schema.get('oneOf'), list) and schema['oneOf']:
-            return clean_schema(schema['oneOf'][0])
+            return clean_schema(schema['oneOf'][0], defs, expanding)
         schema.pop("title", None)
         schema.pop("$ref", None)
         schema.pop("$defs", None)
         if "properties" in schema and isinstance(schema["properties"], dict):
             for key in schema["properties"]:
-                schema["properties"][key] = clean_schema(schema["properties"][key])
+                schema["properties"][key] = clean_schema(schema["properties"][key], defs, expanding)
+        if isinstance(schema.get("items"), dict):
+            schema["items"] = clean_schema(schema["items"], defs, expanding)
     return schema
 
+def tool_guide_line(tool):
+    """Format one prefixed MCP tool as a line of the tool/argument guide."""
+    params = clean_schema(copy.deepcopy(tool.inputSchema or {})).get('properties', {})
+    param_list = ', '.join([f"'{k}'" for k in params.keys()])
+    return f"- {tool.name}({param_list})\n"
+
+def build_tool_guide(guide_lines):
+    """Build the tool/argument guide for Gemini from formatted tool lines."""
+    tool_guide = "Available tools and their arguments:\n"
+    tool_guide += "".join(guide_lines)
+    tool_guide += "\nUse these tools to answer the query. If a tool is needed, call it with the required parameters.\n If an error occurs, provide the error message and a traceback. \n\n"
+    return tool_guide
+
 def convert_mcp_tools_to_gemini(mcp_tools):
     gemini_tools = []
     for tool in mcp_tools:
-        parameters = clean_schema(tool.inputSchema)
+        # Clean a copy so the raw MCP schema stays intact for the manifest cache
+        parameters = clean_schema(copy.deepcopy(tool.inputSchema))
         function_declaration = FunctionDeclaration(
             name=tool.name,
             description=tool.description,
@@ -309,9 +1043,76 @@ async def main():
     #     print("Usage: python client.py <path_to_server_script>")
     #     sys.exit(1)
     
+    parser = argparse.ArgumentParser(description="Terminal MCP client")
+    parser.add_argument("--stream", action="store_true", help="stream Gemini responses as they are generated")
+    parser.add_argument("--lazy", action="store_true", help="spawn servers on first use and stop them when idle")
+    parser.add_argument(
+        "--workers",
+        action="append",
+        default=[],
+        metavar="SERVER=N",
+        help="run N worker processes for a server, e.g. --workers terminal=4",
+    )
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="seconds before an idle lazy server is stopped")
+    parser.add_argument("--no-manifest-cache", action="store_true", help="always list tools from the servers at startup")
+    parser.add_argument("--tool-top-k", type=int, default=12, help="tools offered to Gemini per query (0 offers all)")
+    parser.add_argument(
+        "--context-cache",
+        action="store_true",
+        help="cache the full tool prefix with Gemini context caching instead of per-query tool retrieval",
+    )
+    parser.add_argument("--session", help="resume the saved conversation with this session id")
+    parser.add_argument("--prune-sessions", type=float, metavar="DAYS", help="delete saved sessions idle for DAYS")
+    parser.add_argument("--no-session-store", action="store_true", help="don't save the conversation to disk")
+    parser.add_argument("--profile", action="store_true", help="print a flame table of each query's spans")
+    parser.add_argument("--trace-file", default=DEFAULT_TRACE_PATH, help="rotating JSONL file for latency traces")
+    parser.add_argument("--no-trace", action="store_true", help="don't write latency traces to disk")
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help='run the JSONL queries in FILE ("-" for stdin) headlessly instead of the interactive chat',
+    )
+    parser.add_argument("--output", metavar="FILE", help="JSONL file for batch results (default stdout)")
+    parser.add_argument("--parallelism", type=int, default=4, help="batch queries run at once")
+    parser.add_argument("--serve", action="store_true", help="serve queries over HTTP and WebSocket for many users")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-inflight", type=int, default=16, help="queries the service runs at once")
+    parser.add_argument("--max-waiting", type=int, default=64, help="queries allowed to wait before new ones get 503")
+    parser.add_argument("--user-concurrency", type=int, default=1, help="queries one user may run at once")
+    args = parser.parse_args()
+    server_workers = {}
+    for spec in args.workers:
+        name, _, count = spec.partition("=")
+        if not count.isdigit() or int(count) < 1:
+            parser.error(f"--workers expects SERVER=N, got '{spec}'")
+        server_workers[name] = int(count)
+
     # You can adjust the history length here
     history_length = 5  # Keep last 5 interactions
-    client = MCPClient(history_length=history_length)
+    client = MCPClient(
+        history_length=history_length,
+        stream=args.stream,
+        lazy=args.lazy,
+        server_idle_timeout=args.idle_timeout,
+        tool_manifest_dir=None if args.no_manifest_cache else DEFAULT_MANIFEST_DIR,
+        tool_top_k=args.tool_top_k or None,
+        context_cache=args.context_cache,
+        session_store_path=None if args.no_session_store else DEFAULT_SESSION_DB,
+        session_id=args.session,
+        trace_path=None if args.no_trace else args.trace_file,
+        profile=args.profile,
+        server_workers=server_workers,
+    )
+    if args.prune_sessions is not None and client.session_store is not None:
+        pruned = await asyncio.to_thread(client.session_store.prune, args.prune_sessions * 86400)
+        print(f"Pruned {pruned} saved sessions older than {args.prune_sessions:g} days.")
+    if args.batch:
+        await run_headless(client, args)
+        return
+    if args.serve:
+        await serve(client, args)
+        return
     try:
         await client.connect_to_servers()
         # await client.connect_to_tcp_server()
@@ -320,6 +1121,42 @@ async def main():
     finally:
         await client.cleanup()
 
+async def serve(client: MCPClient, args):
+    """Service mode: one shared set of server sessions, a conversation per user."""
+    import uvicorn
+    from service import AgentService
+
+    service = AgentService(
+        client,
+        max_inflight=args.max_inflight,
+        max_waiting=args.max_waiting,
+        user_concurrency=args.user_concurrency,
+    )
+    config = uvicorn.Config(service.app(), host=args.host, port=args.port, ws="websockets")
+    await uvicorn.Server(config).serve()
+
+async def run_headless(client: MCPClient, args):
+    """Batch mode: results go to --output or stdout, progress output goes to stderr."""
+    results = sys.stdout
+    source = sys.stdin if args.batch == "-" else open(args.batch)
+    output = open(args.output, "w") if args.output else results
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                await client.connect_to_servers()
+                stats = await run_batch(client, source, output, parallelism=max(1, args.parallelism))
+            finally:
+                await client.cleanup()
+        print(
+            f"Batch finished: {stats['ok']} ok, {stats['failed']} failed in {stats['duration']:.1f}s",
+            file=sys.stderr,
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not results:
+            output.close()
+
 if __name__ == "__main__":
     asyncio.run(main())
 
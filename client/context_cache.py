@@ -0,0 +1,96 @@
+import time
+import asyncio
+from typing import Optional
+from google.genai import errors as genai_errors
+from google.genai import types
+
+
+def is_cache_rejection(error: genai_errors.APIError) -> bool:
+    """Whether Gemini refused a request because of the cached content it referenced.
+
+    Not found means the cache expired or was deleted; a bad request or permission error only
+    counts when it names the cache. Rate limits and server errors have nothing to do with it.
+    """
+    if error.code == 404:
+        return True
+    return error.code in (400, 403) and "cache" in str(error.message or "").lower()
+
+
+
+class GeminiContextCache:
+    """Keeps a Gemini cached-content resource holding the tool declarations and tool guide.
+
+    The cache is recreated when the tool set version changes or the TTL is close to
+    running out. If Gemini refuses to create one (for example because the prefix is
+    below the model's minimum cacheable size), that tool set version is sent inline.
+    """
+
+    def __init__(self, genai_client, model: str, ttl_seconds: int = 3600, refresh_margin: float = 120.0):
+        self.genai_client = genai_client
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.name: Optional[str] = None
+        self._version: Optional[int] = None
+        self._expires_at = 0.0
+        self._failed_version: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, tool_set_version: int, tool_guide: str, declarations: list) -> Optional[str]:
+        """Return the cached-content name for this tool set, creating or refreshing it as needed."""
+        async with self._lock:
+            if self._failed_version == tool_set_version:
+                return None
+            fresh = time.monotonic() < self._expires_at - self.refresh_margin
+            if self.name and self._version == tool_set_version and fresh:
+                return self.name
+
+            await self._delete()
+            try:
+                cached_content = await self.genai_client.aio.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f"mcp-client-tools-v{tool_set_version}",
+                        system_instruction=tool_guide,
+                        tools=declarations,
+                        ttl=f"{self.ttl_seconds}s",
+                    ),
+                )
+            except Exception as e:
+                print(f"⚠️  Could not create Gemini context cache, sending tools inline: {e}")
+                self._failed_version = tool_set_version
+                return None
+
+            self.name = cached_content.name
+            self._version = tool_set_version
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            print(f"🗄️  Cached tool prefix as {self.name}")
+            return self.name
+
+    async def reject(self, tool_set_version: int):
+        """Gemini refused a request that referenced the cache: delete it and send this tool set inline."""
+        async with self._lock:
+            await self._delete()
+            # Recreating it for the same tool set would only be refused again, and leak another cache
+            self._failed_version = tool_set_version
+
+    def invalidate(self):
+        """Stop using the current cache, e.g. after Gemini rejected a request that referenced it."""
+        self.name = None
+        self._version = None
+        self._expires_at = 0.0
+
+    async def _delete(self):
+        if self.name is None:
+            return
+        name = self.name
+        self.invalidate()
+        try:
+            await self.genai_client.aio.caches.delete(name=name)
+        except Exception:
+            # It expires on its own anyway
+            pass
+
+    async def close(self):
+        async with self._lock:
+            await self._delete()
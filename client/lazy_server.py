@@ -0,0 +1,222 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Optional
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from mcp import ClientSession
+from mcp import types as mcp_types
+
+
+def first_error(error: BaseException) -> BaseException:
+    """Unwrap task-group exception groups to the first underlying error, for readable messages."""
+    while isinstance(error, BaseExceptionGroup) and error.exceptions:
+        error = error.exceptions[0]
+    return error
+
+
+async def call_tool_cancellable(session: ClientSession, tool_name: str, arguments: Optional[dict], progress_callback=None):
+    """session.call_tool that tells the server to stop the call if it is cancelled on this side.
+
+    The MCP client library doesn't send notifications/cancelled itself, so a cancelled
+    query would otherwise leave commands running on the server.
+    """
+    # send_request takes the next request id synchronously, before its first await
+    request_id = session._request_id
+    try:
+        return await session.call_tool(tool_name, arguments, progress_callback=progress_callback)
+    except asyncio.CancelledError:
+        notification = mcp_types.ClientNotification(mcp_types.CancelledNotification(
+            method="notifications/cancelled",
+            params=mcp_types.CancelledNotificationParams(requestId=request_id, reason="cancelled by client"),
+        ))
+        try:
+            await asyncio.shield(session.send_notification(notification))
+        except Exception:
+            pass
+        raise
+
+
+class ServerDisconnected(ConnectionError):
+    """The connection to a server dropped, or couldn't be opened, for a tool call.
+
+    `sent` is False only when the request provably never reached the server, so it is safe
+    to retry whatever the tool does.
+    """
+
+    def __init__(self, message: str, sent: bool = True):
+        super().__init__(message)
+        self.sent = sent
+
+
+class LazyServer:
+    """An MCP server that is started (or connected to) on first use and shut down after sitting idle.
+
+    Each spawn is owned by a dedicated task that enters and exits the transport,
+    since the transport's cancel scopes must be closed by the task that opened them.
+    After the connection drops, the next acquire() starts a new one. With no
+    idle_timeout the connection stays open until close().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        transport: Callable[[], AbstractAsyncContextManager],
+        idle_timeout: Optional[float],
+        startup_timeout: float,
+        message_handler=None,
+        remote: bool = False,
+        heartbeat_interval: float = 10.0,
+        on_connect: Optional[Callable[[ClientSession], Awaitable[None]]] = None,
+    ):
+        self.name = name
+        # Zero-argument factory for the transport context manager, e.g. partial(stdio_client, params)
+        self.transport = transport
+        self.remote = remote
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.startup_timeout = startup_timeout
+        self.message_handler = message_handler
+        # Run on every new session before it is handed out, e.g. to restore server-side state
+        self.on_connect = on_connect
+        self.session: Optional[ClientSession] = None
+        self.spawn_count = 0
+        self._lock = asyncio.Lock()
+        self._in_flight = 0
+        self._last_used = time.monotonic()
+        self._stop = asyncio.Event()
+        self._disconnected = asyncio.Event()
+        self._owner_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.session is not None
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Yield a live session, spawning the server first if it isn't running."""
+        async with self._lock:
+            if self.session is None:
+                await self._spawn()
+            self._in_flight += 1
+        try:
+            yield self.session
+        finally:
+            self._in_flight -= 1
+            self._last_used = time.monotonic()
+
+    async def _spawn(self):
+        print(f"{'Connecting to' if self.remote else 'Starting'} {self.name} server on demand...")
+        ready = asyncio.get_running_loop().create_future()
+        self._stop = stop = asyncio.Event()
+        self._disconnected = disconnected = asyncio.Event()
+        self._owner_task = asyncio.create_task(self._run(ready, stop, disconnected))
+        try:
+            await asyncio.wait_for(ready, timeout=self.startup_timeout)
+        except BaseException:
+            self._owner_task.cancel()
+            raise
+        self.spawn_count += 1
+
+    async def _run(self, ready: asyncio.Future, stop: asyncio.Event, disconnected: asyncio.Event):
+        # An idle server tears down outside the lock, so by the time this spawn ends a newer one
+        # may own self.session and the events; only this spawn's own state is touched here
+        session = None
+        try:
+            async with self.transport() as streams:
+                # streamable HTTP also yields a session id getter after the two streams
+                read_stream, write_stream = streams[0], streams[1]
+                async with ClientSession(read_stream, write_stream, message_handler=self.message_handler) as session:
+                    await session.initialize()
+                    if self.on_connect is not None:
+                        await self.on_connect(session)
+                    self.session = session
+                    self._last_used = time.monotonic()
+                    if not ready.done():
+                        ready.set_result(session)
+                    await self._wait_until_idle(stop)
+        except Exception as e:
+            e = first_error(e)
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"⚠️  {self.name} server exited: {e}")
+        finally:
+            if self.session is session:
+                self.session = None
+            disconnected.set()
+
+    async def call_tool(self, tool_name: str, arguments: Optional[dict], progress_callback=None):
+        """Call a tool, raising ServerDisconnected instead of hanging if the connection drops mid-call."""
+        sent = False
+        try:
+            async with self.acquire() as session:
+                disconnected = self._disconnected
+                if disconnected.is_set():
+                    raise ServerDisconnected(f"lost connection to {self.name} server", sent=False)
+                sent = True
+                call = asyncio.ensure_future(call_tool_cancellable(session, tool_name, arguments, progress_callback))
+                lost = asyncio.ensure_future(self._watch_connection(session, disconnected))
+                try:
+                    done, _ = await asyncio.wait({call, lost}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    lost.cancel()
+                    if not call.done():
+                        call.cancel()
+                if call in done:
+                    return call.result()
+        except ServerDisconnected:
+            raise
+        except Exception as e:
+            if sent or not self.remote:
+                raise
+            # Connecting failed, so the request was never sent
+            raise ServerDisconnected(f"could not connect to {self.name} server: {first_error(e)}", sent=False) from e
+        if not disconnected.is_set():
+            # The peer stopped answering pings but the transport hasn't noticed; drop it
+            await self.reset()
+        raise ServerDisconnected(f"lost connection to {self.name} server")
+
+    async def _watch_connection(self, session: ClientSession, disconnected: asyncio.Event):
+        """Return once the connection is gone. Remote servers are pinged during long calls,
+        since an HTTP transport can keep waiting on a response from a peer that died."""
+        while True:
+            try:
+                await asyncio.wait_for(disconnected.wait(), timeout=self.heartbeat_interval)
+                return
+            except asyncio.TimeoutError:
+                if not self.remote:
+                    continue
+            try:
+                await asyncio.wait_for(session.send_ping(), timeout=self.heartbeat_interval)
+            except Exception:
+                return
+
+    async def _wait_until_idle(self, stop: asyncio.Event):
+        if self.idle_timeout is None:
+            await stop.wait()
+            return
+        while not stop.is_set():
+            idle_for = time.monotonic() - self._last_used
+            if self._in_flight == 0 and idle_for >= self.idle_timeout:
+                # Clear the session before yielding so no new caller picks up a closing server
+                self.session = None
+                print(f"💤 Shutting down {self.name} server after {idle_for:.0f}s idle.")
+                return
+            wait_for = self.idle_timeout - idle_for if self._in_flight == 0 else self.idle_timeout
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=max(wait_for, 0.1))
+            except asyncio.TimeoutError:
+                pass
+
+    async def reset(self):
+        """Drop the current connection so the next acquire() opens a fresh one."""
+        async with self._lock:
+            await self.close()
+            self.session = None
+
+    async def close(self):
+        self._stop.set()
+        if self._owner_task is not None:
+            try:
+                await self._owner_task
+            except (asyncio.CancelledError, Exception):
+                pass
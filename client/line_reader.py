@@ -0,0 +1,40 @@
+import sys
+import asyncio
+import threading
+from typing import Optional
+
+
+class AsyncLineReader:
+    """Read lines from a blocking stream on a daemon thread and hand them to asyncio.
+
+    Lines typed while a query is still running are queued, so several queries
+    can be submitted ahead of time and are picked up in order.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(target=self._read_lines, name="stdin-reader", daemon=True)
+        self._thread.start()
+
+    def _read_lines(self):
+        while True:
+            line = self.stream.readline()
+            if not line:
+                # EOF: wake the consumer with a sentinel and stop
+                self._loop.call_soon_threadsafe(self.queue.put_nowait, None)
+                return
+            self._loop.call_soon_threadsafe(self.queue.put_nowait, line.rstrip("\n"))
+
+    def pending(self) -> int:
+        """Number of type-ahead lines waiting to be read."""
+        return self.queue.qsize()
+
+    async def readline(self) -> Optional[str]:
+        """Return the next line, or None once the stream is closed."""
+        return await self.queue.get()
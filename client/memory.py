@@ -0,0 +1,170 @@
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+from google.genai import types
+
+# Rough chars-per-token ratio for Gemini; good enough for budgeting without a count_tokens round-trip
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(contents: list[types.Content]) -> int:
+    """Cheap local token estimate for a list of contents."""
+    chars = sum(len(content.model_dump_json(exclude_none=True)) for content in contents)
+    return chars // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class Turn:
+    """One query with its tool calls, tool results and final answer, as native Gemini contents."""
+    contents: list[types.Content]
+    tokens: int
+    timestamp: float = field(default_factory=time.time)
+
+
+class ConversationMemory:
+    """Multi-turn conversation memory kept within a token budget.
+
+    Recent turns are replayed verbatim. When the budget or max_turns is exceeded the
+    oldest turns are folded into a running summary by the summarizer callable.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 8000,
+        max_turns: Optional[int] = None,
+        summarizer: Optional[Callable[[str, list[types.Content]], Awaitable[str]]] = None,
+        on_compact: Optional[Callable[[str, int], None]] = None,
+        on_clear: Optional[Callable[[], None]] = None,
+    ):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.summarizer = summarizer
+        self.on_compact = on_compact
+        self.on_clear = on_clear
+        self.turns: list[Turn] = []
+        self.summary = ""
+        # Turns ever added, and how many of the oldest ones the summary covers
+        self.turn_count = 0
+        self.compacted_turns = 0
+        self._summary_tokens = 0
+        self._compaction: Optional[asyncio.Task] = None
+        self._restore: Optional[Callable[[], Awaitable[None]]] = None
+
+    @property
+    def tokens(self) -> int:
+        return self._summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def add_turn(self, contents: list[types.Content]):
+        """Record a finished turn and start compacting in the background if over budget."""
+        self.turns.append(Turn(contents=contents, tokens=estimate_tokens(contents)))
+        self.turn_count += 1
+        if self._over_budget() and (self._compaction is None or self._compaction.done()):
+            self._compaction = asyncio.create_task(self.compact())
+
+    def _over_budget(self) -> bool:
+        too_many = self.max_turns is not None and len(self.turns) > self.max_turns
+        return too_many or (self.tokens > self.token_budget and len(self.turns) > 1)
+
+    async def compact(self):
+        """Fold the oldest turns into the running summary until memory fits again."""
+        evicted = []
+        # Always keep the latest turn verbatim
+        while self._over_budget() and len(self.turns) > 1:
+            evicted.append(self.turns.pop(0))
+        if not evicted:
+            return
+        evicted_contents = [content for turn in evicted for content in turn.contents]
+        try:
+            if self.summarizer is None:
+                raise RuntimeError("no summarizer configured")
+            self.summary = await self.summarizer(self.summary, evicted_contents)
+        except Exception as e:
+            print(f"⚠️  Could not summarize conversation, keeping a plain-text digest: {e}")
+            self.summary = (self.summary + "\n" + digest(evicted_contents)).strip()
+        self._summary_tokens = len(self.summary) // CHARS_PER_TOKEN + 1
+        self.compacted_turns += len(evicted)
+        if self.on_compact is not None:
+            self.on_compact(self.summary, self.compacted_turns)
+
+    def restore_from(self, loader: Callable[[], Awaitable[Optional[tuple[str, int, list[list[types.Content]], int]]]]):
+        """Defer loading a saved session until the memory is first read, so resuming doesn't slow startup.
+
+        The loader returns (summary, compacted_turns, turns, turn_count) or None.
+        """
+        self._restore = loader
+
+    async def _apply_restore(self):
+        loader, self._restore = self._restore, None
+        snapshot = await loader()
+        if snapshot is None:
+            return
+        summary, compacted_turns, turns, turn_count = snapshot
+        restored = [Turn(contents=contents, tokens=estimate_tokens(contents)) for contents in turns]
+        self.turns = restored + self.turns
+        self.summary = summary
+        self._summary_tokens = len(summary) // CHARS_PER_TOKEN + 1 if summary else 0
+        self.compacted_turns = compacted_turns
+        self.turn_count += turn_count
+
+    async def context(self) -> list[types.Content]:
+        """Contents to prepend to a new query: the running summary, then the recent turns."""
+        if self._restore is not None:
+            await self._apply_restore()
+            if self._over_budget():
+                await self.compact()
+        if self._compaction is not None and not self._compaction.done():
+            await self._compaction
+        contents = []
+        if self.summary:
+            contents.append(types.Content(
+                role='user',
+                parts=[types.Part.from_text(text=f"Summary of the earlier conversation:\n{self.summary}")]
+            ))
+        for turn in self.turns:
+            contents.extend(turn.contents)
+        return contents
+
+    def clear(self):
+        """Forget every turn and the summary. turn_count keeps counting, so turns recorded after
+        a clear never reuse the index of one recorded before it."""
+        if self._compaction is not None:
+            self._compaction.cancel()
+            self._compaction = None
+        if self._restore is not None:
+            # The saved session isn't replayed any more, but its turns still count
+            loader = self._restore
+
+            async def counts_only():
+                snapshot = await loader()
+                return None if snapshot is None else ("", snapshot[3], [], snapshot[3])
+
+            self._restore = counts_only
+        self.turns = []
+        self.summary = ""
+        self.compacted_turns = self.turn_count
+        self._summary_tokens = 0
+        if self.on_clear is not None:
+            self.on_clear()
+
+
+@dataclass
+class Conversation:
+    """One conversation's memory, the session id its events are stored under, and the tools it
+    used most recently (newest last), which stay pinned into its tool retrieval results."""
+    session_id: str
+    memory: ConversationMemory
+    recent_tools: OrderedDict[str, None] = field(default_factory=OrderedDict)
+
+
+def digest(contents: list[types.Content], limit: int = 200) -> str:
+    """Plain-text fallback summary: each text and tool call on one truncated line."""
+    lines = []
+    for content in contents:
+        for part in content.parts or []:
+            if part.text:
+                lines.append(f"{content.role}: {part.text[:limit]}")
+            elif part.function_call:
+                lines.append(f"{content.role} called {part.function_call.name}({part.function_call.args})")
+    return "\n".join(lines)
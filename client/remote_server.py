@@ -0,0 +1,62 @@
+from functools import partial
+from typing import Optional
+import anyio
+import httpx
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+
+def pooled_http_client_factory(max_connections: int, keepalive_expiry: float = 60.0):
+    """httpx client factory for MCP HTTP transports with a bounded keep-alive connection pool.
+
+    Concurrent tool calls to one server reuse up to max_connections warm connections
+    instead of opening a new one per request.
+    """
+    limits = httpx.Limits(
+        # One more for the long-lived GET stream the streamable HTTP transport keeps open
+        max_connections=max_connections + 1,
+        max_keepalive_connections=max_connections + 1,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+    def factory(
+        headers: Optional[dict[str, str]] = None,
+        timeout: Optional[httpx.Timeout] = None,
+        auth: Optional[httpx.Auth] = None,
+    ) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers=headers,
+            timeout=timeout or httpx.Timeout(30.0),
+            auth=auth,
+            limits=limits,
+            follow_redirects=True,
+        )
+
+    return factory
+
+
+def remote_transport(config: dict, max_connections: int):
+    """Zero-argument transport factory for a server_configs entry with a "url".
+
+    "transport" is "streamable-http" (the default) or "sse"; "headers" are sent with every request.
+    """
+    client = sse_client if config.get("transport", "streamable-http") == "sse" else streamablehttp_client
+    return partial(
+        client,
+        config["url"],
+        headers=config.get("headers"),
+        httpx_client_factory=pooled_http_client_factory(max_connections),
+    )
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Whether a failed call means the connection to a remote server is gone, so reconnecting may help."""
+    if isinstance(error, McpError):
+        # The session fails pending requests with this code when its transport closes
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(
+        error,
+        (httpx.TransportError, ConnectionError, EOFError, anyio.ClosedResourceError, anyio.BrokenResourceError),
+    )
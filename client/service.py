@@ -0,0 +1,220 @@
+import json
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+from memory import Conversation
+
+
+class AdmissionError(Exception):
+    """A query was refused because the service or the user is at capacity."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass
+class UserState:
+    conversation: Conversation
+    # Queries from one user run one at a time by default so their turns stay in order
+    semaphore: asyncio.Semaphore
+    queued: int = 0
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+class AgentService:
+    """Serves process_query to many users over one MCPClient and its shared server sessions.
+
+    Each user gets their own conversation (resumable from the session store under
+    "user-<id>"). A global in-flight limit with a bounded wait queue provides admission
+    control, and a per-user concurrency and queue limit stops one user from taking
+    every slot. Users are identified by the X-User header, so the service is meant to
+    run behind an authenticating proxy.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_inflight: int = 16,
+        max_waiting: int = 64,
+        user_concurrency: int = 1,
+        user_queue: int = 4,
+        user_idle_timeout: float = 3600.0,
+    ):
+        self.client = client
+        self.max_inflight = max_inflight
+        self.max_waiting = max_waiting
+        self.user_concurrency = user_concurrency
+        self.user_queue = user_queue
+        self.user_idle_timeout = user_idle_timeout
+        self.users: dict[str, UserState] = {}
+        self.inflight = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _user(self, user_id: str) -> UserState:
+        state = self.users.get(user_id)
+        if state is None:
+            conversation = self.client.new_conversation(f"user-{user_id}", resume=True)
+            state = UserState(conversation=conversation, semaphore=asyncio.Semaphore(self.user_concurrency))
+            self.users[user_id] = state
+        state.last_seen = time.monotonic()
+        return state
+
+    async def query(self, user_id: str, query: str) -> dict:
+        """Admit, queue and run one query for a user; raises AdmissionError when over capacity."""
+        state = self._user(user_id)
+        if state.queued >= self.user_concurrency + self.user_queue:
+            raise AdmissionError(f"too many queries in flight for user '{user_id}'", 429)
+        if self.waiting >= self.max_waiting and self._slots.locked():
+            raise AdmissionError("service is at capacity", 503, retry_after=5)
+
+        state.queued += 1
+        try:
+            # Take the user's own slot first so a busy user waits without holding a global one
+            async with state.semaphore:
+                self.waiting += 1
+                try:
+                    await self._slots.acquire()
+                finally:
+                    self.waiting -= 1
+                self.inflight += 1
+                started = time.perf_counter()
+                try:
+                    response = await self.client.process_query(query, state.conversation)
+                finally:
+                    self.inflight -= 1
+                    self._slots.release()
+        finally:
+            state.queued -= 1
+            state.last_seen = time.monotonic()
+        return {
+            "response": response,
+            "session_id": state.conversation.session_id,
+            "duration": round(time.perf_counter() - started, 4),
+        }
+
+    async def _reap_idle_users(self):
+        """Drop idle users' in-memory state; their conversation stays in the session store."""
+        while True:
+            await asyncio.sleep(min(60.0, self.user_idle_timeout))
+            cutoff = time.monotonic() - self.user_idle_timeout
+            for user_id, state in list(self.users.items()):
+                if state.queued == 0 and state.last_seen < cutoff:
+                    del self.users[user_id]
+
+    def status(self) -> dict:
+        return {
+            "servers": sorted(set(self.client.sessions) | set(self.client.lazy_servers)),
+            "degraded_servers": self.client.degraded_servers,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "max_inflight": self.max_inflight,
+            "users": len(self.users),
+        }
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        await self.client.connect_to_servers()
+        self._reaper = asyncio.create_task(self._reap_idle_users())
+        try:
+            yield
+        finally:
+            self._reaper.cancel()
+            await self.client.cleanup()
+
+    def app(self) -> Starlette:
+        return Starlette(
+            routes=[
+                Route("/query", self.http_query, methods=["POST"]),
+                Route("/users/{user_id}/conversation", self.http_clear, methods=["DELETE"]),
+                Route("/health", self.http_health, methods=["GET"]),
+                WebSocketRoute("/ws", self.websocket_query),
+            ],
+            lifespan=self.lifespan,
+        )
+
+    async def http_query(self, request: Request) -> JSONResponse:
+        user_id = request.headers.get("x-user")
+        if not user_id:
+            return JSONResponse({"error": "missing X-User header"}, status_code=401)
+        try:
+            body = await request.json()
+        except ValueError:
+            return JSONResponse({"error": "body must be JSON"}, status_code=400)
+        query = body.get("query") if isinstance(body, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            return JSONResponse({"error": 'expected {"query": "..."}'}, status_code=400)
+        try:
+            return JSONResponse(await self.query(user_id, query))
+        except AdmissionError as e:
+            return JSONResponse(
+                {"error": str(e)}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)}
+            )
+        except Exception as e:
+            return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=500)
+
+    async def http_clear(self, request: Request) -> JSONResponse:
+        user_id = request.headers.get("x-user")
+        if not user_id:
+            return JSONResponse({"error": "missing X-User header"}, status_code=401)
+        if user_id != request.path_params["user_id"]:
+            return JSONResponse({"error": "can only clear your own conversation"}, status_code=403)
+        # Also for users whose state was reaped, so the stored conversation isn't resumed later
+        self._user(user_id).conversation.memory.clear()
+        return JSONResponse({"cleared": True})
+
+    async def http_health(self, request: Request) -> JSONResponse:
+        return JSONResponse(self.status())
+
+    async def websocket_query(self, websocket: WebSocket):
+        """Each message {"id": ..., "query": ...} is answered with {"id": ..., "response"|"error": ...}.
+
+        Several queries may be sent without waiting; they are subject to the same limits as HTTP.
+        """
+        user_id = websocket.headers.get("x-user") or websocket.query_params.get("user")
+        if not user_id:
+            await websocket.close(code=1008, reason="missing user")
+            return
+        await websocket.accept()
+        tasks: set[asyncio.Task] = set()
+        send_lock = asyncio.Lock()
+
+        async def answer(message_id, query: str):
+            try:
+                reply = {"id": message_id, **await self.query(user_id, query)}
+            except AdmissionError as e:
+                reply = {"id": message_id, "error": str(e), "status": e.status_code}
+            except Exception as e:
+                reply = {"id": message_id, "error": f"{type(e).__name__}: {e}"}
+            async with send_lock:
+                await websocket.send_json(reply)
+
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                except ValueError:
+                    message = None
+                query = message.get("query") if isinstance(message, dict) else None
+                if not isinstance(query, str):
+                    await websocket.send_json({"error": 'expected {"id": ..., "query": "..."}'})
+                    continue
+                task = asyncio.create_task(answer(message.get("id"), query))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Nobody is left to read the answers
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from dataclasses import dataclass
+from contextlib import closing
+from typing import Any, Optional
+from google.genai import types
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    turn_index INTEGER,
+    kind TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    duration REAL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_session_kind ON events(session_id, kind, turn_index);
+"""
+
+_STOP = object()
+
+
+def _jsonable(value: Any) -> Any:
+    """json.dumps fallback for pydantic models such as MCP tool result content."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return str(value)
+
+
+@dataclass
+class SessionSnapshot:
+    """What's needed to resume a session's memory: the latest summary and the turns after it."""
+    summary: str
+    compacted_turns: int
+    turns: list[list[types.Content]]
+    turn_count: int
+
+
+class SessionStore:
+    """Append-only SQLite (WAL) store of conversation turns, summaries, tool calls and results.
+
+    Writes are queued and committed in batches by a background thread, so recording
+    never blocks the event loop. Reads use their own connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_batches, name="session-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write_batches(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                # Drain whatever queued up meanwhile so bursts land in one transaction
+                while len(batch) < 500:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = any(item is _STOP for item in batch)
+                statements = [item for item in batch if item is not _STOP]
+                if statements:
+                    try:
+                        with conn:
+                            for sql, params in statements:
+                                conn.execute(sql, params)
+                    except sqlite3.Error as e:
+                        print(f"⚠️  Session store write failed: {e}")
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def record(
+        self,
+        session_id: str,
+        kind: str,
+        payload: Any,
+        turn_index: Optional[int] = None,
+        duration: Optional[float] = None,
+    ):
+        """Queue an event for the session; returns immediately."""
+        now = time.time()
+        self._queue.put((
+            "INSERT INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, now, now),
+        ))
+        self._queue.put((
+            "INSERT INTO events (session_id, turn_index, kind, created_at, duration, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, turn_index, kind, now, duration, json.dumps(payload, default=_jsonable)),
+        ))
+
+    def record_turn(self, session_id: str, turn_index: int, contents: list[types.Content], duration: float):
+        self.record(
+            session_id,
+            "turn",
+            [content.model_dump(mode="json", exclude_none=True) for content in contents],
+            turn_index=turn_index,
+            duration=duration,
+        )
+
+    def load(self, session_id: str) -> Optional[SessionSnapshot]:
+        """Load the latest summary and the turns it doesn't cover. Blocking; run it off the event loop.
+
+        Nothing recorded before the latest "clear" event is replayed, though its turns still count.
+        """
+        with closing(self._connect()) as conn:
+            if conn.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is None:
+                return None
+            (cleared_at,) = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM events WHERE session_id = ? AND kind = 'clear'", (session_id,)
+            ).fetchone()
+            # A clear covers every turn before it, like a summary that is empty
+            (compacted_turns,) = conn.execute(
+                "SELECT COALESCE(MAX(turn_index) + 1, 0) FROM events WHERE session_id = ? AND kind = 'turn' AND id < ?",
+                (session_id, cleared_at),
+            ).fetchone()
+            summary = ""
+            row = conn.execute(
+                "SELECT payload FROM events WHERE session_id = ? AND kind = 'summary' AND id > ? ORDER BY id DESC LIMIT 1",
+                (session_id, cleared_at),
+            ).fetchone()
+            if row:
+                payload = json.loads(row[0])
+                summary, compacted_turns = payload["summary"], payload["compacted_turns"]
+            rows = conn.execute(
+                "SELECT payload FROM events WHERE session_id = ? AND kind = 'turn' AND id > ? AND turn_index >= ? "
+                "ORDER BY turn_index",
+                (session_id, cleared_at, compacted_turns),
+            ).fetchall()
+            (turn_count,) = conn.execute(
+                "SELECT COALESCE(MAX(turn_index) + 1, 0) FROM events WHERE session_id = ? AND kind = 'turn'",
+                (session_id,),
+            ).fetchone()
+        turns = [[types.Content.model_validate(content) for content in json.loads(payload)] for (payload,) in rows]
+        return SessionSnapshot(summary, compacted_turns, turns, max(turn_count, compacted_turns))
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Delete sessions not updated within max_age_seconds. Returns how many were removed."""
+        cutoff = time.time() - max_age_seconds
+        with closing(self._connect()) as conn, conn:
+            stale = [row[0] for row in conn.execute("SELECT id FROM sessions WHERE updated_at < ?", (cutoff,))]
+            conn.executemany("DELETE FROM events WHERE session_id = ?", [(session_id,) for session_id in stale])
+            conn.executemany("DELETE FROM sessions WHERE id = ?", [(session_id,) for session_id in stale])
+        return len(stale)
+
+    def close(self):
+        """Flush queued writes and stop the writer thread. Blocking."""
+        self._queue.put(_STOP)
+        self._thread.join()
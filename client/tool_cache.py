@@ -0,0 +1,66 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class ToolResultCache:
+    """Size-bounded LRU cache with per-entry TTL for read-only MCP tool results.
+
+    Entries are keyed on server, tool and canonicalized arguments. Only tools the
+    caller has marked read-only should ever be stored here.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped by every invalidation, so a read that overlapped a write can tell not to store its result
+        self._generations: dict[str, int] = {}
+
+    @staticmethod
+    def make_key(server_name: str, tool_name: str, args: Optional[dict]) -> tuple:
+        canonical_args = json.dumps(args or {}, sort_keys=True, separators=(",", ":"), default=str)
+        return (server_name, tool_name, canonical_args)
+
+    def get(self, key: tuple) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple, value: Any, ttl: float):
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def generation(self, server_name: str) -> int:
+        return self._generations.get(server_name, 0)
+
+    def invalidate_server(self, server_name: str):
+        """Drop every cached result for one server."""
+        self._generations[server_name] = self.generation(server_name) + 1
+        for key in [key for key in self._entries if key[0] == server_name]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+from typing import Optional
+from mcp import types as mcp_types
+from google.genai.types import Tool
+
+MANIFEST_VERSION = 1
+
+
+def manifest_key(config: dict) -> str:
+    """Hash a server's launch command, args and the contents of any script files it runs, or its URL."""
+    digest = hashlib.sha256()
+    if "url" in config:
+        # A remote server's tools can change without the config changing; the background
+        # handshake reconciles them with the live list
+        digest.update(json.dumps(
+            {"version": MANIFEST_VERSION, "url": config["url"], "transport": config.get("transport")},
+            sort_keys=True,
+        ).encode())
+        return digest.hexdigest()
+    digest.update(json.dumps({
+        "version": MANIFEST_VERSION,
+        "command": config["command"],
+        "args": config["args"],
+        # Only env names: values are usually secrets and don't change the tool list
+        "env": sorted((config.get("env") or {}).keys()),
+    }, sort_keys=True).encode())
+    for arg in config["args"]:
+        if os.path.isfile(arg):
+            with open(arg, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ToolManifestCache:
+    """On-disk cache of each server's tool list and converted Gemini declarations.
+
+    One JSON file per server, reused only while the server's manifest key still matches.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, server_name: str) -> str:
+        return os.path.join(self.directory, f"{server_name}.json")
+
+    def load(self, server_name: str, config: dict) -> Optional[tuple[list[mcp_types.Tool], list[Tool]]]:
+        try:
+            with open(self._path(server_name)) as f:
+                manifest = json.load(f)
+            if manifest.get("key") != manifest_key(config):
+                return None
+            tools = [mcp_types.Tool.model_validate(tool) for tool in manifest["tools"]]
+            declarations = [Tool.model_validate(declaration) for declaration in manifest["declarations"]]
+        except (OSError, ValueError, KeyError):
+            return None
+        return tools, declarations
+
+    def save(self, server_name: str, config: dict, tools: list[mcp_types.Tool], declarations: list[Tool]):
+        manifest = {
+            "key": manifest_key(config),
+            "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in tools],
+            "declarations": [declaration.model_dump(mode="json", exclude_none=True) for declaration in declarations],
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temp file first so a crash never leaves a truncated manifest behind
+            tmp_path = self._path(server_name) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self._path(server_name))
+        except OSError as e:
+            print(f"⚠️  Could not write tool manifest for {server_name}: {e}")
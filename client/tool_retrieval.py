@@ -0,0 +1,55 @@
+import re
+import math
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z][a-z]*|[0-9]+")
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "by", "with", "from",
+    "is", "it", "me", "my", "i", "you", "this", "that", "please", "can", "could",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens, splitting snake_case and camelCase identifiers and dropping stop words."""
+    tokens = (token.lower() for token in TOKEN_PATTERN.findall(text or ""))
+    return [token for token in tokens if token not in STOP_WORDS]
+
+
+class ToolIndex:
+    """In-memory BM25 index over tool names, descriptions and parameter names."""
+
+    def __init__(self, documents: dict[str, str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = {name: Counter(tokenize(text)) for name, text in documents.items()}
+        self.lengths = {name: sum(counts.values()) for name, counts in self.term_counts.items()}
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter()
+        for counts in self.term_counts.values():
+            document_frequency.update(counts.keys())
+        total = len(self.term_counts)
+        self.idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_frequency.items()
+        }
+
+    def search(self, query: str, k: int) -> list[str]:
+        """Return up to k tool names ranked by relevance; tools with no matching term are left out."""
+        query_terms = set(tokenize(query))
+        scores = {}
+        for name, counts in self.term_counts.items():
+            score = 0.0
+            length_norm = 1 - self.b + self.b * (self.lengths[name] / self.avg_length if self.avg_length else 0)
+            for term in query_terms:
+                freq = counts.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + self.k1 * length_norm)
+            if score > 0:
+                scores[name] = score
+        return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def tool_document(server_name: str, tool) -> str:
+    """Text indexed for one MCP tool; the name is repeated so it outweighs long descriptions."""
+    params = (tool.inputSchema or {}).get("properties", {})
+    return " ".join([server_name, tool.name, tool.name, tool.description or "", " ".join(params.keys())])
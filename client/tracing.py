@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Optional
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def payload_size(value: Any) -> int:
+    """Approximate serialized size in bytes of a tool argument or result payload."""
+    def default(obj):
+        if hasattr(obj, "model_dump"):
+            return obj.model_dump(mode="json", exclude_none=True)
+        return str(obj)
+    return len(json.dumps(value, default=default))
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"], attrs: dict):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.attrs = attrs
+        self.children: list[Span] = []
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_record(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attrs": self.attrs,
+        }
+
+    def walk(self, depth: int = 0):
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+
+class Tracer:
+    """Records nested latency spans and writes each finished trace to a rotating JSONL file.
+
+    Span nesting follows contextvars, so spans opened inside tasks started by gather()
+    attach to the span that was current when the task was created.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        profile: bool = False,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+    ):
+        self.profile = profile
+        self._listener: Optional[QueueListener] = None
+        self._logger: Optional[logging.Logger] = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            # File writes happen on the listener thread, not the event loop
+            log_queue: queue.Queue = queue.Queue()
+            self._listener = QueueListener(log_queue, file_handler)
+            self._listener.start()
+            self._logger = logging.getLogger(f"mcp_client.trace.{id(self)}")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            self._logger.addHandler(QueueHandler(log_queue))
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = _current_span.get()
+        span = Span(name, parent, attrs)
+        if parent is not None:
+            parent.children.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._started
+            _current_span.reset(token)
+            if parent is None:
+                self._finish_trace(span)
+
+    def _finish_trace(self, root: Span):
+        if self._logger is not None:
+            for _, span in root.walk():
+                self._logger.info(json.dumps(span.to_record(), default=str))
+        if self.profile:
+            print(format_flame_table(root))
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+def format_flame_table(root: Span, width: int = 30) -> str:
+    """Render a trace as an indented table of spans with durations and proportional bars."""
+    total = root.duration or 1e-9
+    lines = [f"\n{'span':<48} {'ms':>10} {'%':>6}  "]
+    for depth, span in root.walk():
+        duration = span.duration or 0.0
+        label = "  " * depth + span.name
+        details = " ".join(
+            f"{key}={value}" for key, value in span.attrs.items()
+            if key in ("server", "tool", "iteration", "prompt_tokens", "output_tokens", "args_bytes", "result_bytes", "error")
+        )
+        bar_start = int(width * ((span.start_time - root.start_time) / total))
+        bar_length = max(1, int(width * duration / total))
+        bar = " " * min(bar_start, width - 1) + "█" * min(bar_length, width - min(bar_start, width - 1))
+        lines.append(f"{label[:48]:<48} {duration * 1000:>10.1f} {100 * duration / total:>5.1f}%  {bar:<{width}}  {details}")
+    return "\n".join(lines)
@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+from mcp import ClientSession
+from lazy_server import LazyServer
+
+
+class WorkerPool:
+    """Several processes of one MCP server behind a single server name.
+
+    Calls go to the least-loaded worker. Tools in primary_tools always run on worker 0.
+    Tools in replicated_tools change per-process state that every worker must share
+    (such as the terminal server's workspace): they run on the primary, whose result is
+    returned, then on every other running worker, and they are replayed on workers
+    started later. Exposes the same interface as LazyServer, so the client treats a pool
+    like any other on-demand server.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        transport: Callable,
+        workers: int,
+        idle_timeout: Optional[float],
+        startup_timeout: float,
+        message_handler=None,
+        primary_tools: Optional[list[str]] = None,
+        replicated_tools: Optional[list[str]] = None,
+    ):
+        self.name = name
+        self.remote = False
+        self.primary_tools = set(primary_tools or [])
+        self.replicated_tools = set(replicated_tools or [])
+        # Latest arguments of each replicated tool, replayed on newly started workers
+        self.replicated_state: dict[str, Optional[dict]] = {}
+        self.workers = [
+            LazyServer(
+                f"{name}#{index}",
+                transport,
+                # The primary holds the state, so it is never reaped for idleness
+                idle_timeout=None if index == 0 else idle_timeout,
+                startup_timeout=startup_timeout,
+                message_handler=message_handler if index == 0 else None,
+                on_connect=self._replay_state,
+            )
+            for index in range(workers)
+        ]
+        # Calls routed to each worker and not yet finished, counted from the moment of routing
+        self.load = [0] * workers
+
+    @property
+    def primary(self) -> LazyServer:
+        return self.workers[0]
+
+    @property
+    def running(self) -> bool:
+        return self.primary.running
+
+    @property
+    def spawn_count(self) -> int:
+        return sum(worker.spawn_count for worker in self.workers)
+
+    async def start(self):
+        """Start every worker in parallel so the first burst of calls doesn't pay for cold starts."""
+        async def warm(worker: LazyServer):
+            async with worker.acquire():
+                pass
+        results = await asyncio.gather(*(warm(worker) for worker in self.workers[1:]), return_exceptions=True)
+        for worker, result in zip(self.workers[1:], results):
+            if isinstance(result, Exception):
+                print(f"⚠️  {worker.name} worker failed to start: {result}")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """The primary's session, used for listing tools and other non-call requests."""
+        async with self.primary.acquire() as session:
+            yield session
+
+    async def _replay_state(self, session: ClientSession):
+        for tool_name, arguments in self.replicated_state.items():
+            await session.call_tool(tool_name, arguments)
+
+    def _least_loaded(self) -> int:
+        # Prefer running workers so a call doesn't wait for a spawn while another worker is free
+        return min(range(len(self.workers)), key=lambda index: (self.load[index], not self.workers[index].running))
+
+    async def call_tool(self, tool_name: str, arguments: Optional[dict], progress_callback=None):
+        if tool_name in self.replicated_tools:
+            return await self._call_replicated(tool_name, arguments)
+        index = 0 if tool_name in self.primary_tools else self._least_loaded()
+        self.load[index] += 1
+        try:
+            return await self.workers[index].call_tool(tool_name, arguments, progress_callback)
+        finally:
+            self.load[index] -= 1
+
+    async def _call_replicated(self, tool_name: str, arguments: Optional[dict]):
+        result = await self.primary.call_tool(tool_name, arguments)
+        if result.isError:
+            return result
+        self.replicated_state[tool_name] = arguments
+        others = [worker for worker in self.workers[1:] if worker.running]
+        outcomes = await asyncio.gather(
+            *(worker.call_tool(tool_name, arguments) for worker in others), return_exceptions=True
+        )
+        for worker, outcome in zip(others, outcomes):
+            if isinstance(outcome, Exception) or outcome.isError:
+                # Out of sync with the primary; restart it so the state is replayed on connect
+                print(f"⚠️  {worker.name} worker failed to apply {tool_name}, restarting it.")
+                await worker.reset()
+        return result
+
+    async def reset(self):
+        for worker in self.workers:
+            await worker.reset()
+
+    async def close(self):
+        await asyncio.gather(*(worker.close() for worker in self.workers))
@@ -3,6 +3,7 @@ import os
 import pickle
 from typing import Optional
 from mcp.server.fastmcp import FastMCP
+from transport import run_server
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
@@ -56,4 +57,4 @@ async def create_reminder(summary: str, date: str) -> str:
     return f"Reminder created: {event.get('htmlLink')}"
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
+    run_server(mcp, default_port=8704)
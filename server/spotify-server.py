@@ -1,77 +1,130 @@
-import os
 import sys
 import shutil
+import asyncio
 import subprocess
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+from collections import deque
+from typing import Optional
 from dotenv import load_dotenv
+from pydantic import BaseModel, Field
 from mcp.server.fastmcp import FastMCP
+from spotify_api import SpotifyCatalog
+from transport import run_server
 
 load_dotenv()
 
 mcp = FastMCP("spotify")
+_catalog: Optional[SpotifyCatalog] = None
 
-@mcp.tool()
-async def play_song(song_name: str, artist: str) -> str:
-    # query song name and artist to get track id
-    sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-        client_id=os.getenv("SPOTIFY_CLIENT_ID"),
-        client_secret=os.getenv("SPOTIFY_CLIENT_SECRET")
-    ))
-    results = sp.search(q=f"track:{song_name} artist:{artist}", type="track")
-    if results["tracks"]["items"]:
-        track_id = results["tracks"]["items"][0]["id"]
-    else:
-        return f"Could not find track '{song_name}' by artist '{artist}'."
 
-    print(f'osascript command: tell application "Spotify" to play track "spotify:track:{track_id}"', file=sys.stderr)
-    # run subprocess to open Spotify and play using track id
+def get_catalog() -> SpotifyCatalog:
+    """The process-wide Spotify client, so its token, connections and lookups are reused across calls."""
+    global _catalog
+    if _catalog is None:
+        _catalog = SpotifyCatalog.from_env()
+    return _catalog
+
+
+class TrackRequest(BaseModel):
+    song_name: str = Field(description="Song title")
+    artist: str = Field(description="Artist name")
+
+
+# Tracks queued by queue_tracks as (track id, label); the Spotify app's AppleScript
+# interface has no queue, so next_track plays these before falling back to the app
+up_next: deque[tuple[str, str]] = deque()
+
+
+def play_in_app(kind: str, item_id: str):
+    """Open the Spotify app and play a track or playlist by ID through AppleScript."""
+    if not shutil.which("osascript"):
+        raise OSError("AppleScript is not available on this system")
+    command = f'tell application "Spotify" to play {kind} "spotify:{kind}:{item_id}"'
+    print(f"osascript command: {command}", file=sys.stderr)
     subprocess.run(['open', '-a', 'Spotify'])
+    subprocess.run(['osascript', '-e', command], check=True)
 
-    try:
-        subprocess.run([
-            'osascript',
-            '-e', f'tell application "Spotify" to play track "spotify:track:{track_id}"'
-        ], check=True)
 
-        if not shutil.which("osascript"):
-            return "AppleScript is not available on this system."
+def play_track(track_id: str):
+    play_in_app("track", track_id)
 
-        return f"Playing '{song_name}' by {artist} in Spotify app."
-    except subprocess.CalledProcessError as e:
+
+@mcp.tool()
+async def play_song(song_name: str, artist: str) -> str:
+    # query song name and artist to get track id
+    try:
+        track_id = await asyncio.to_thread(get_catalog().find_track, song_name, artist)
+    except Exception as e:
+        return f"Failed to search Spotify: {e}"
+    if track_id is None:
+        return f"Could not find track '{song_name}' by artist '{artist}'."
+    up_next.clear()
+    try:
+        play_track(track_id)
+    except (subprocess.CalledProcessError, OSError) as e:
         return f"Failed to play song: {e}"
+    return f"Playing '{song_name}' by {artist} in Spotify app."
     
 @mcp.tool()
 async def play_from_playlist(playlist_name: str) -> str:
-    sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-        client_id=os.getenv("SPOTIFY_CLIENT_ID"),
-        client_secret=os.getenv("SPOTIFY_CLIENT_SECRET")
-    ))
-    results = sp.search(q=f"playlist:{playlist_name}", type="playlist")
-    if results["playlists"]["items"]:
-        playlist_id = results["playlists"]["items"][0]["id"]
-    else:
+    try:
+        playlist_id = await asyncio.to_thread(get_catalog().find_playlist, playlist_name)
+    except Exception as e:
+        return f"Failed to search Spotify: {e}"
+    if playlist_id is None:
         return f"Could not find playlist '{playlist_name}'."
-
-    print(f'osascript command: tell application "Spotify" to play playlist "spotify:playlist:{playlist_id}"', file=sys.stderr)
-
-    subprocess.run(['open', '-a', 'Spotify'])
-
+    up_next.clear()
     try:
-        subprocess.run([
-            'osascript',
-            '-e', f'tell application "Spotify" to play playlist "spotify:playlist:{playlist_id}"'
-        ], check=True)
-
-        if not shutil.which("osascript"):
-            return "AppleScript is not available on this system."
-
-        return f"Playing playlist '{playlist_name}' in Spotify app."
-    except subprocess.CalledProcessError as e:
+        play_in_app("playlist", playlist_id)
+    except (subprocess.CalledProcessError, OSError) as e:
         return f"Failed to play playlist: {e}"
+    return f"Playing playlist '{playlist_name}' in Spotify app."
+
+@mcp.tool()
+async def queue_tracks(tracks: list[TrackRequest], play_now: bool = True) -> str:
+    """Find several songs in one call and queue them. With play_now the first one starts
+    playing and replaces the current queue; otherwise they are added after it. next_track
+    plays the queued songs in order. Songs that can't be found are reported and skipped."""
+    if not tracks:
+        return "No tracks given."
+    try:
+        results = await asyncio.to_thread(get_catalog().find_tracks, [(t.song_name, t.artist) for t in tracks])
+    except Exception as e:
+        return f"Failed to search Spotify: {e}"
+
+    found = []
+    failures = []
+    for track, (track_id, error) in zip(tracks, results):
+        label = f"'{track.song_name}' by {track.artist}"
+        if track_id is None:
+            failures.append(f"- {label}: {error}")
+        else:
+            found.append((track_id, label))
+
+    lines = []
+    if found and play_now:
+        up_next.clear()
+        first_id, first_label = found.pop(0)
+        try:
+            play_track(first_id)
+            lines.append(f"Playing {first_label} in Spotify app.")
+        except (subprocess.CalledProcessError, OSError) as e:
+            failures.insert(0, f"- {first_label}: failed to play: {e}")
+    up_next.extend(found)
+    if found:
+        lines.append(f"Queued {len(found)}{' more' if play_now else ''}: " + ", ".join(label for _, label in found) + ".")
+    if failures:
+        lines.append(f"Could not queue {len(failures)} of {len(tracks)}:\n" + "\n".join(failures))
+    return "\n".join(lines)
 
 @mcp.tool()
 async def next_track() -> str:
+    if up_next:
+        track_id, label = up_next.popleft()
+        try:
+            play_track(track_id)
+            return f"Playing {label} from the queue ({len(up_next)} left)."
+        except (subprocess.CalledProcessError, OSError) as e:
+            return f"Failed to play {label}: {e}"
     try:
         subprocess.run([
             'osascript',
@@ -137,4 +190,4 @@ async def quit() -> str:
         return f"Failed to quit Spotify: {e}"
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    run_server(mcp, default_port=8702)
\ No newline at end of file
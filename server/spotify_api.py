@@ -0,0 +1,151 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+
+
+def normalize(text: str) -> str:
+    """Cache key form of a search term: case-folded with whitespace collapsed."""
+    return " ".join(text.casefold().split())
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SpotifyCatalog:
+    """Resolves track and playlist names to Spotify IDs through one shared Web API client.
+
+    The client-credentials token is cached in memory and refreshed only when it expires,
+    requests go over a single keep-alive session, and resolved IDs are cached on the
+    normalized query, so repeating a request doesn't touch the network at all.
+
+    api_url and token_url point the client at a stand-in for the Web API, e.g. in tests.
+    """
+
+    def __init__(
+        self,
+        client_id: Optional[str],
+        client_secret: Optional[str],
+        api_url: Optional[str] = None,
+        token_url: Optional[str] = None,
+        cache_size: int = 1024,
+        cache_ttl: float = 24 * 3600,
+        max_connections: int = 8,
+    ):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        auth_manager = SpotifyClientCredentials(
+            client_id=client_id,
+            client_secret=client_secret,
+            requests_session=self.session,
+            # Not the default file cache, which writes a .cache file into the working directory
+            cache_handler=MemoryCacheHandler(),
+        )
+        if token_url:
+            auth_manager.OAUTH_TOKEN_URL = token_url
+        self.spotify = spotipy.Spotify(auth_manager=auth_manager, requests_session=self.session, requests_timeout=10)
+        if api_url:
+            self.spotify.prefix = api_url.rstrip("/") + "/"
+        self.cache = TTLCache(cache_size, cache_ttl)
+        # One search per connection at a time, so batch lookups never open extra connections
+        self.executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="spotify")
+
+    @classmethod
+    def from_env(cls) -> "SpotifyCatalog":
+        return cls(
+            client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+            client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
+            api_url=os.getenv("SPOTIFY_API_URL"),
+            token_url=os.getenv("SPOTIFY_TOKEN_URL"),
+            cache_ttl=float(os.getenv("SPOTIFY_CACHE_TTL", 24 * 3600)),
+        )
+
+    def _first_id(self, key: tuple, query: str, kind: str) -> Optional[str]:
+        item_id = self.cache.get(key)
+        if item_id is not None:
+            return item_id
+        results = self.spotify.search(q=query, type=kind, limit=1)
+        items = [item for item in results[f"{kind}s"]["items"] if item]
+        if not items:
+            return None
+        item_id = items[0]["id"]
+        self.cache.put(key, item_id)
+        return item_id
+
+    def find_track(self, song_name: str, artist: str) -> Optional[str]:
+        song_name, artist = normalize(song_name), normalize(artist)
+        return self._first_id(("track", song_name, artist), f"track:{song_name} artist:{artist}", "track")
+
+    def find_playlist(self, playlist_name: str) -> Optional[str]:
+        playlist_name = normalize(playlist_name)
+        return self._first_id(("playlist", playlist_name), f"playlist:{playlist_name}", "playlist")
+
+    def find_tracks(self, tracks: list[tuple[str, str]]) -> list[tuple[Optional[str], Optional[str]]]:
+        """Resolve many (song name, artist) pairs at once, returning (track id, error) for each.
+
+        The search endpoint has no batch form, so the batch is made cheap instead: duplicates
+        are looked up once, cached IDs need no request, the token is fetched before fanning
+        out, and the remaining searches run in parallel over the shared connection pool.
+        """
+        keys = [(normalize(song_name), normalize(artist)) for song_name, artist in tracks]
+        unique = list(dict.fromkeys(keys))
+        resolved: dict[tuple[str, str], tuple[Optional[str], Optional[str]]] = {}
+        misses = []
+        for key in unique:
+            track_id = self.cache.get(("track", *key))
+            if track_id is not None:
+                resolved[key] = (track_id, None)
+            else:
+                misses.append(key)
+        if misses:
+            try:
+                # Otherwise every parallel search would request its own token on a cold start
+                self.spotify.auth_manager.get_access_token(as_dict=False)
+            except Exception as e:
+                return [resolved.get(key, (None, f"authentication failed: {e}")) for key in keys]
+
+            def lookup(key: tuple[str, str]) -> tuple[Optional[str], Optional[str]]:
+                try:
+                    track_id = self.find_track(*key)
+                except Exception as e:
+                    return None, f"search failed: {e}"
+                return (track_id, None) if track_id else (None, "not found")
+
+            resolved.update(zip(misses, self.executor.map(lookup, misses)))
+        return [resolved[key] for key in keys]
@@ -0,0 +1,54 @@
+import asyncio
+import hashlib
+import argparse
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Stand-in for the Spotify accounts and Web API endpoints the spotify server uses, for testing it
+# without credentials or network access. Start the spotify server with
+#   SPOTIFY_API_URL=http://127.0.0.1:8790/v1 SPOTIFY_TOKEN_URL=http://127.0.0.1:8790/api/token
+# Searches containing "missing" find nothing; GET /stats counts the requests served.
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=8790)
+parser.add_argument("--latency", type=float, default=0.05, help="seconds each API request takes")
+args = parser.parse_args()
+
+stats = {"token": 0, "search": 0}
+
+
+def fake_id(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()[:22]
+
+
+async def token(request: Request) -> JSONResponse:
+    stats["token"] += 1
+    return JSONResponse({"access_token": "stub-token", "token_type": "Bearer", "expires_in": 3600})
+
+
+async def search(request: Request) -> JSONResponse:
+    stats["search"] += 1
+    await asyncio.sleep(args.latency)
+    if request.headers.get("authorization") != "Bearer stub-token":
+        return JSONResponse({"error": {"status": 401, "message": "Invalid access token"}}, status_code=401)
+    query = request.query_params.get("q", "")
+    kinds = request.query_params.get("type", "track").split(",")
+    limit = int(request.query_params.get("limit", 10))
+    found = [] if "missing" in query else [{"id": fake_id(query), "name": query}]
+    return JSONResponse({f"{kind}s": {"items": found[:limit], "total": len(found)} for kind in kinds})
+
+
+async def get_stats(request: Request) -> JSONResponse:
+    return JSONResponse(stats)
+
+
+app = Starlette(routes=[
+    Route("/api/token", token, methods=["POST"]),
+    Route("/v1/search", search, methods=["GET"]),
+    Route("/stats", get_stats, methods=["GET"]),
+])
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
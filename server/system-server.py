@@ -1,5 +1,6 @@
 import subprocess
 from mcp.server.fastmcp import FastMCP
+from transport import run_server
 
 mcp = FastMCP("system")
 
@@ -55,4 +56,4 @@ async def open_application(app_name: str) -> str:
         return f"Failed to open application: {app_name}"
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
+    run_server(mcp, default_port=8703)
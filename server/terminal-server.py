@@ -1,24 +1,487 @@
 import os
+import re
+import sys
+import pty
+import time
+import uuid
+import codecs
+import signal
+import asyncio
+import termios
 import subprocess
-from mcp.server.fastmcp import FastMCP
+import anyio
+from typing import Optional
+from collections import OrderedDict
+from mcp.server.fastmcp import Context, FastMCP
+from mcp.types import ToolAnnotations
+from transport import run_server
+from workspace_index import WorkspaceIndex, read_range, render_tree, required_literals
 
 mcp = FastMCP("terminal")
 DEFAULT_WORKSPACE = os.path.expanduser("/Users/johnzhang/Desktop/Development/Workspace")
+DEFAULT_TIMEOUT_SECONDS = 300.0
+# Output kept in the tool result; the middle of anything longer is dropped
+MAX_OUTPUT_BYTES = 64 * 1024
+READ_CHUNK_BYTES = 4096
+PROGRESS_INTERVAL_SECONDS = 0.5
+KILL_GRACE_SECONDS = 2.0
+# Starts a program in a new session with the PTY on fds 0-2 as its controlling terminal. A helper
+# process rather than a preexec_fn, which can deadlock the child of a process running threads
+LOGIN_TTY = "import os, sys; os.login_tty(0); os.execvp(sys.argv[1], sys.argv[1:])"
+# Shell sessions left unused this long are closed
+SHELL_IDLE_TIMEOUT_SECONDS = float(os.getenv("TERMINAL_SHELL_IDLE_TIMEOUT", 900))
+MAX_SHELL_SESSIONS = 8
+MAX_SEARCH_RESULTS = 200
+# Search indexes kept for roots other than the current workspace, least recently used dropped first
+MAX_EXTRA_INDEXES = 2
+
+class OutputBuffer:
+    """Captured command output capped at `limit` bytes, keeping the head and the tail."""
+
+    def __init__(self, limit: int):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+
+    def write(self, data: bytes):
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        self.tail += data
+        overflow = len(self.tail) - self.tail_limit
+        if overflow > 0:
+            del self.tail[:overflow]
+            self.dropped += overflow
+
+    def text(self) -> str:
+        head = self.head.decode(errors="replace")
+        tail = self.tail.decode(errors="replace")
+        if self.dropped:
+            return f"{head}\n... [{self.dropped} bytes of output omitted] ...\n{tail}"
+        return head + tail
+
+
+class ProgressStream:
+    """Forwards command output to the client as progress notifications, batched so chatty
+    commands don't flood it."""
+
+    def __init__(self, ctx: Context):
+        self.ctx = ctx
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.received = 0
+        self.unsent = ""
+        self.last_sent = time.monotonic()
+
+    async def write(self, data: bytes):
+        self.received += len(data)
+        self.unsent = (self.unsent + self.decoder.decode(data))[-MAX_OUTPUT_BYTES:]
+        if time.monotonic() - self.last_sent >= PROGRESS_INTERVAL_SECONDS:
+            await self.flush()
+
+    async def flush(self):
+        if self.unsent:
+            await self.ctx.report_progress(self.received, message=self.unsent)
+            self.unsent = ""
+        self.last_sent = time.monotonic()
+
+
+async def terminate(process: asyncio.subprocess.Process):
+    """Stop a command and everything it started: SIGTERM its process group, then SIGKILL."""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=KILL_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+    except ProcessLookupError:
+        pass
+
 
 @mcp.tool()
-async def run_command(command: str) -> str:
+async def run_command(command: str, ctx: Context, timeout: float = DEFAULT_TIMEOUT_SECONDS) -> str:
+    """Run a shell command in the workspace. Output is streamed as progress while it runs;
+    the result keeps the first and last parts of long output."""
     try:
-        result = subprocess.run(
+        process = await asyncio.create_subprocess_shell(
             command,
-            shell=True,
-            text=True,
-            capture_output=True,
-            cwd=DEFAULT_WORKSPACE
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=DEFAULT_WORKSPACE,
+            # Own process group, so a timeout or cancel also kills the command's children
+            start_new_session=True,
         )
-        return result.stdout or result.stderr
     except Exception as e:
         return str(e)
-    
+
+    output = OutputBuffer(MAX_OUTPUT_BYTES)
+    progress = ProgressStream(ctx)
+    timed_out = False
+    try:
+        async with asyncio.timeout(timeout):
+            while chunk := await process.stdout.read(READ_CHUNK_BYTES):
+                output.write(chunk)
+                await progress.write(chunk)
+            await process.wait()
+    except TimeoutError:
+        timed_out = True
+    finally:
+        # Also runs when the client cancels the call. Shielded, since the handler's cancelled
+        # scope would otherwise cancel the wait for SIGTERM and never get to SIGKILL
+        with anyio.CancelScope(shield=True):
+            await terminate(process)
+    await progress.flush()
+
+    result = output.text()
+    if timed_out:
+        result += f"\n[timed out after {timeout:g}s; command killed]"
+    elif process.returncode:
+        result += f"\n[exit code {process.returncode}]"
+    return result
+
+class ShellClosed(Exception):
+    """The session's shell exited or was closed."""
+
+
+class ShellSession:
+    """A long-lived bash on a PTY that keeps its environment, virtualenv and working directory
+    between commands.
+
+    Each command is followed by a printf of a unique sentinel and its exit status, so the
+    output of one command is framed without waiting for the shell to go quiet.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.master_fd = -1
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self._pending = bytearray()
+        self._readable = asyncio.Event()
+        self._eof = False
+        # Drains the output of an interrupted command before the next one runs
+        self._recovery: Optional[asyncio.Task] = None
+
+    async def start(self, cwd: str):
+        master_fd, slave_fd = pty.openpty()
+        attributes = termios.tcgetattr(slave_fd)
+        attributes[1] &= ~termios.OPOST  # keep "\n" rather than "\r\n"
+        attributes[3] &= ~termios.ECHO  # don't echo commands back into the output
+        termios.tcsetattr(slave_fd, termios.TCSANOW, attributes)
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                # New session with the PTY as its controlling terminal, so Ctrl-C reaches the running command
+                sys.executable, "-c", LOGIN_TTY,
+                "bash", "--noprofile", "--norc", "--noediting", "-i",
+                stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+                cwd=cwd,
+                env={**os.environ, "PS1": "", "PS2": "", "TERM": "dumb", "PAGER": "cat", "GIT_PAGER": "cat"},
+            )
+        except Exception:
+            os.close(master_fd)
+            raise
+        finally:
+            os.close(slave_fd)
+        self.master_fd = master_fd
+        os.set_blocking(master_fd, False)
+        asyncio.get_running_loop().add_reader(master_fd, self._on_readable)
+        # Swallow anything bash prints on startup
+        await self.exec("", None, timeout=10.0)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.master_fd, READ_CHUNK_BYTES * 16)
+        except BlockingIOError:
+            return
+        except OSError:
+            # EIO once the shell has exited and the PTY is hung up
+            data = b""
+        if data:
+            self._pending += data
+        else:
+            self._eof = True
+            asyncio.get_running_loop().remove_reader(self.master_fd)
+        self._readable.set()
+
+    async def _read(self) -> bytes:
+        while not self._pending and not self._eof:
+            self._readable.clear()
+            await self._readable.wait()
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
+
+    async def _read_until(self, sentinel: bytes, output: Optional[OutputBuffer], progress: Optional[ProgressStream]) -> int:
+        """Collect output up to the sentinel line and return the command's exit status."""
+        pattern = re.compile(rb"\n?" + re.escape(sentinel) + rb"(\d+)\n")
+        # Output held back because it may be the start of the sentinel
+        unsent = b""
+        while True:
+            data = await self._read()
+            if not data:
+                raise ShellClosed(f"shell '{self.name}' exited")
+            unsent += data
+            match = pattern.search(unsent)
+            if match:
+                data, status = unsent[:match.start()], int(match.group(1))
+            else:
+                hold = len(sentinel) + 8
+                data, unsent = unsent[:-hold], unsent[-hold:]
+            if data:
+                if output is not None:
+                    output.write(data)
+                if progress is not None:
+                    await progress.write(data)
+            if match:
+                return status
+
+    async def _frame(self, command: str, output: Optional[OutputBuffer], progress: Optional[ProgressStream]) -> int:
+        """Run one command followed by a unique sentinel and return its exit status."""
+        sentinel = f"__mcp_done_{uuid.uuid4().hex}__"
+        await self._send(f"{command}\nprintf '\\n{sentinel}%d\\n' $?\n")
+        return await self._read_until(sentinel.encode(), output, progress)
+
+    async def _send(self, text: str):
+        data = text.encode()
+        while data:
+            try:
+                data = data[os.write(self.master_fd, data):]
+            except BlockingIOError:
+                # The PTY input queue is full until the shell reads it; only for very long commands
+                await asyncio.sleep(0.01)
+
+    async def _interrupt(self):
+        """Ctrl-C the running command and wait until the shell is ready for the next one."""
+        try:
+            await self._send("\x03")
+            # Ctrl-C flushes unread input, which may include the command's own sentinel, so frame
+            # a fresh one; an earlier sentinel that did get printed is discarded along the way
+            async with asyncio.timeout(KILL_GRACE_SECONDS):
+                await self._frame("", None, None)
+        except (TimeoutError, ShellClosed, OSError):
+            # Ignores SIGINT or already gone; a shell in an unknown state can't be reused
+            await self.close()
+
+    async def exec(self, command: str, progress: Optional[ProgressStream], timeout: float) -> str:
+        async with self.lock:
+            if self._recovery is not None:
+                await self._recovery
+                self._recovery = None
+            if self.closed:
+                raise ShellClosed(f"shell '{self.name}' is closed")
+            self.last_used = time.monotonic()
+            output = OutputBuffer(MAX_OUTPUT_BYTES)
+            try:
+                async with asyncio.timeout(timeout):
+                    status = await self._frame(command, output, progress)
+            except TimeoutError:
+                await self._interrupt()
+                status = None
+            except asyncio.CancelledError:
+                # The client cancelled the call: stop the command, but don't make the caller wait for it
+                self._recovery = asyncio.create_task(self._interrupt())
+                raise
+            finally:
+                self.last_used = time.monotonic()
+            if progress is not None:
+                await progress.flush()
+
+        result = output.text()
+        if status is None:
+            state = "interrupted" if not self.closed else "shell closed"
+            result += f"\n[timed out after {timeout:g}s; {state}]"
+        elif status:
+            result += f"\n[exit code {status}]"
+        return result
+
+    @property
+    def closed(self) -> bool:
+        return self._eof or self.process is None or self.process.returncode is not None
+
+    async def close(self):
+        if self.master_fd >= 0:
+            asyncio.get_running_loop().remove_reader(self.master_fd)
+            os.close(self.master_fd)
+            self.master_fd = -1
+            self._eof = True
+            self._readable.set()
+        if self.process is not None:
+            await terminate(self.process)
+
+
+shell_sessions: dict[str, ShellSession] = {}
+_shell_reaper: Optional[asyncio.Task] = None
+
+
+async def _reap_idle_shells():
+    while shell_sessions:
+        await asyncio.sleep(min(60.0, SHELL_IDLE_TIMEOUT_SECONDS))
+        cutoff = time.monotonic() - SHELL_IDLE_TIMEOUT_SECONDS
+        for name, session in list(shell_sessions.items()):
+            if session.closed or (not session.lock.locked() and session.last_used < cutoff):
+                del shell_sessions[name]
+                await session.close()
+
+
+async def get_shell(name: str, cwd: Optional[str] = None) -> ShellSession:
+    global _shell_reaper
+    session = shell_sessions.get(name)
+    if session is not None:
+        if not session.closed:
+            return session
+        # The shell exited (e.g. `exit`); release its PTY and start a fresh one
+        await session.close()
+    if session is None and len(shell_sessions) >= MAX_SHELL_SESSIONS:
+        raise ValueError(f"too many open shells ({MAX_SHELL_SESSIONS}); close one first")
+    session = ShellSession(name)
+    await session.start(cwd or DEFAULT_WORKSPACE)
+    shell_sessions[name] = session
+    if _shell_reaper is None or _shell_reaper.done():
+        _shell_reaper = asyncio.create_task(_reap_idle_shells())
+    return session
+
+
+@mcp.tool()
+async def open_shell(name: str = "default", cwd: Optional[str] = None) -> str:
+    """Open a named, persistent shell session (starting in the workspace unless cwd is given).
+    Environment variables, activated virtualenvs and the current directory carry over between
+    shell_exec calls in the same session."""
+    if name in shell_sessions and not shell_sessions[name].closed:
+        return f"Shell '{name}' is already open."
+    if cwd is not None and not os.path.isdir(cwd):
+        return f"Invalid directory: {cwd}"
+    try:
+        await get_shell(name, cwd)
+    except Exception as e:
+        return f"Failed to open shell '{name}': {e}"
+    return f"Opened shell '{name}'."
+
+
+@mcp.tool()
+async def shell_exec(command: str, ctx: Context, name: str = "default", timeout: float = DEFAULT_TIMEOUT_SECONDS) -> str:
+    """Run a command in a persistent shell session, opening it if needed. Output is streamed
+    as progress; a command still running at the timeout is interrupted with Ctrl-C."""
+    try:
+        session = await get_shell(name)
+        return await session.exec(command, ProgressStream(ctx), timeout)
+    except Exception as e:
+        return f"Shell '{name}' failed: {e}"
+
+
+@mcp.tool()
+async def close_shell(name: str = "default") -> str:
+    """Close a persistent shell session and everything still running in it."""
+    session = shell_sessions.pop(name, None)
+    if session is None:
+        return f"No open shell named '{name}'."
+    await session.close()
+    return f"Closed shell '{name}'."
+
+
+def workspace_path(path: str) -> str:
+    """Resolve a tool's path argument against the workspace."""
+    return os.path.normpath(os.path.join(DEFAULT_WORKSPACE, os.path.expanduser(path)))
+
+
+@mcp.tool(annotations=ToolAnnotations(readOnlyHint=True))
+async def read_file(
+    path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+) -> str:
+    """Read a file in the workspace, optionally only lines start_line..end_line (1-based, inclusive)
+    or `length` bytes from `offset`. Long results are cut with a note on how to continue."""
+    try:
+        return await asyncio.to_thread(
+            read_range, workspace_path(path), MAX_OUTPUT_BYTES, start_line, end_line, offset, length
+        )
+    except Exception as e:
+        return f"Failed to read {path}: {e}"
+
+
+workspace_indexes: OrderedDict[str, tuple[WorkspaceIndex, asyncio.Lock]] = OrderedDict()
+
+
+def get_index(root: str) -> tuple[WorkspaceIndex, asyncio.Lock]:
+    """The search index for a root and the lock serializing its refreshes, creating them on first use.
+
+    The current workspace's index is always kept; indexes of other roots (paths outside the
+    workspace, or previous workspaces) are bounded, since each can hold tens of thousands of files.
+    """
+    if root not in workspace_indexes:
+        workspace_indexes[root] = (WorkspaceIndex(root), asyncio.Lock())
+    workspace_indexes.move_to_end(root)
+    extra = [other for other in workspace_indexes if other != DEFAULT_WORKSPACE]
+    for other in extra[:max(len(extra) - MAX_EXTRA_INDEXES, 0)]:
+        del workspace_indexes[other]
+    return workspace_indexes[root]
+
+
+@mcp.tool(annotations=ToolAnnotations(readOnlyHint=True))
+async def search(
+    query: str,
+    path: str = ".",
+    regex: bool = False,
+    case_sensitive: bool = False,
+    glob: Optional[str] = None,
+    max_results: int = 50,
+) -> str:
+    """Search file contents under a workspace path, like grep -rn. The query is plain text unless
+    regex is set; glob (e.g. "*.py") limits which files are searched. Uses an index kept up to
+    date from file modification times, so repeated searches are fast."""
+    if not query:
+        return "Empty query."
+    target = workspace_path(path)
+    if not os.path.isdir(target):
+        return f"Not a directory: {path}"
+    # One index per workspace; a path outside it gets an index of its own
+    root, prefix = DEFAULT_WORKSPACE, os.path.relpath(target, DEFAULT_WORKSPACE)
+    if prefix.startswith(".."):
+        root, prefix = target, "."
+    try:
+        pattern = re.compile(query if regex else re.escape(query), 0 if case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        return f"Invalid regular expression: {e}"
+    literals = required_literals(query) if regex else [query]
+
+    index, lock = get_index(root)
+    async with lock:
+        def refresh_and_search():
+            index.refresh()
+            return index.search(
+                pattern, literals, "" if prefix == "." else prefix, glob, min(max(max_results, 1), MAX_SEARCH_RESULTS)
+            )
+        matches, stopped = await asyncio.to_thread(refresh_and_search)
+
+    if not matches:
+        return f"No matches for {query!r} in {path}."
+    result = "\n".join(matches)
+    if stopped:
+        result += f"\n[stopped after {len(matches)} matches; narrow the search with path or glob]"
+    if index.truncated:
+        result += f"\n[only the first {len(index.files)} files of this tree are indexed]"
+    return result
+
+
+@mcp.tool(annotations=ToolAnnotations(readOnlyHint=True))
+async def list_tree(path: str = ".", depth: int = 2, ignore: Optional[list[str]] = None, max_entries: int = 500) -> str:
+    """List a workspace directory as an indented tree down to `depth` levels. Skips .git,
+    node_modules, virtualenvs and whatever .gitignore excludes; `ignore` adds more
+    gitignore-style patterns."""
+    target = workspace_path(path)
+    if not os.path.isdir(target):
+        return f"Not a directory: {path}"
+    return await asyncio.to_thread(render_tree, target, max(depth, 1), ignore, min(max_entries, 2000))
+
+
 @mcp.tool()
 async def initiate_repo(repo_name: str) -> str:
     repo_path = os.path.join(DEFAULT_WORKSPACE, repo_name)
@@ -42,4 +505,4 @@ async def change_workspace(new_workspace: str) -> str:
         return f"Invalid workspace path: {new_workspace}"
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    run_server(mcp, default_port=8701)
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Server modules are standalone scripts imported flat, as the servers themselves do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
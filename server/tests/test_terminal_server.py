@@ -0,0 +1,76 @@
+import os
+import subprocess
+import importlib.util
+import anyio
+
+spec = importlib.util.spec_from_file_location(
+    "terminal_server", os.path.join(os.path.dirname(os.path.dirname(__file__)), "terminal-server.py")
+)
+terminal_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(terminal_server)
+
+
+class FakeContext:
+    async def report_progress(self, progress, total=None, message=None):
+        pass
+
+
+def process_group_alive(pgid: int) -> bool:
+    """Whether any process of the group is still running; zombies left for init to reap don't count."""
+    listing = subprocess.run(["ps", "-A", "-o", "pgid=,stat="], capture_output=True, text=True, check=True).stdout
+    return any(int(group) == pgid and not stat.startswith("Z") for group, stat in map(str.split, listing.splitlines()))
+
+
+def test_cancelled_command_is_killed_even_if_it_ignores_sigterm(tmp_path, monkeypatch):
+    monkeypatch.setattr(terminal_server, "DEFAULT_WORKSPACE", str(tmp_path))
+    monkeypatch.setattr(terminal_server, "KILL_GRACE_SECONDS", 0.2)
+    pid_file = tmp_path / "pid"
+
+    async def main():
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(terminal_server.run_command, f"trap '' TERM; echo $$ > {pid_file}; sleep 30", FakeContext())
+            with anyio.fail_after(5):
+                while not pid_file.exists() or not pid_file.read_text().strip():
+                    await anyio.sleep(0.02)
+            # Like the MCP server cancelling a handler when the client cancels the request
+            tg.cancel_scope.cancel()
+        return int(pid_file.read_text())
+
+    pgid = anyio.run(main)
+    assert not process_group_alive(pgid)
+
+
+def test_search_keeps_few_indexes_besides_the_workspace(tmp_path, monkeypatch):
+    workspace = tmp_path / "workspace"
+    others = [tmp_path / f"other{i}" for i in range(4)]
+    for root in [workspace, *others]:
+        root.mkdir()
+        (root / "notes.txt").write_text("needle\n")
+    monkeypatch.setattr(terminal_server, "DEFAULT_WORKSPACE", str(workspace))
+    monkeypatch.setattr(terminal_server, "workspace_indexes", terminal_server.OrderedDict())
+
+    async def main():
+        assert "notes.txt:1: needle" in await terminal_server.search("needle")
+        for root in others:
+            assert "notes.txt:1: needle" in await terminal_server.search("needle", path=str(root))
+
+    anyio.run(main)
+    kept = list(terminal_server.workspace_indexes)
+    assert kept[0] == str(workspace)
+    assert kept[1:] == [str(root) for root in others[-terminal_server.MAX_EXTRA_INDEXES:]]
+
+
+def test_shell_session_interrupts_a_command_at_its_timeout(tmp_path):
+    async def main():
+        session = terminal_server.ShellSession("test")
+        await session.start(str(tmp_path))
+        try:
+            # The PTY is the shell's controlling terminal, so Ctrl-C stops the command but not the shell
+            assert (await session.exec("tty", None, timeout=5)).startswith("/dev/")
+            result = await session.exec("export KEPT=yes; sleep 30", None, timeout=0.5)
+            assert "interrupted" in result
+            assert (await session.exec("echo $KEPT", None, timeout=5)).strip() == "yes"
+        finally:
+            await session.close()
+
+    anyio.run(main)
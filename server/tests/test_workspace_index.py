@@ -0,0 +1,60 @@
+import re
+from workspace_index import WorkspaceIndex, required_literals
+
+
+def build_index(tmp_path, files: dict[str, str]) -> WorkspaceIndex:
+    for name, text in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    index = WorkspaceIndex(str(tmp_path))
+    index.refresh()
+    return index
+
+
+def search(index: WorkspaceIndex, query: str, **kwargs) -> list[str]:
+    matches, _ = index.search(re.compile(query), required_literals(query), **kwargs)
+    return matches
+
+
+def test_required_literals():
+    assert required_literals("def foo") == ["def foo"]
+    assert required_literals(r"^def \w+") == ["def "]
+    assert required_literals(r"return$") == ["return"]
+    assert required_literals(r"foo\.bar\(") == ["foo.bar("]
+    assert required_literals(r"colou?r_name") == ["colo", "r_name"]
+    assert required_literals("[a-z]+_handler") == ["_handler"]
+    assert required_literals("(foo)?barbaz") == ["barbaz"]
+    # Either side of an alternation may be missing, so nothing is required
+    assert required_literals("foo|barbaz") == []
+    assert required_literals("ab") == []
+
+
+def test_search_anchors_match_lines(tmp_path):
+    index = build_index(tmp_path, {"a.py": "import os\n\ndef hello():\n    return os.sep\n"})
+    assert search(index, r"^def \w+") == ["a.py:3: def hello():"]
+    assert search(index, r"def \w+") == ["a.py:3: def hello():"]
+    assert search(index, r"os\.sep$") == ["a.py:4: return os.sep"]
+    assert search(index, r"^return") == []
+
+
+def test_search_alternation_and_classes(tmp_path):
+    index = build_index(tmp_path, {
+        "a.py": "class Alpha:\n    pass\n",
+        "b/b.py": "class Beta:\n    pass\n",
+        "c.txt": "nothing here\n",
+    })
+    assert search(index, "Alpha|Beta") == ["a.py:1: class Alpha:", "b/b.py:1: class Beta:"]
+    assert search(index, r"class [AB]\w+:") == ["a.py:1: class Alpha:", "b/b.py:1: class Beta:"]
+    assert search(index, r"class [AB]\w+:", prefix="b") == ["b/b.py:1: class Beta:"]
+    assert search(index, "pass", glob="*.txt") == []
+
+
+def test_search_sees_changed_files(tmp_path):
+    index = build_index(tmp_path, {"a.py": "old_name = 1\n"})
+    assert search(index, "new_name") == []
+    # A different size, so the change is seen even where mtimes are coarse
+    (tmp_path / "a.py").write_text("new_name = 20\n")
+    index.refresh()
+    assert search(index, "new_name") == ["a.py:1: new_name = 20"]
+    assert search(index, "old_name") == []
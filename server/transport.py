@@ -0,0 +1,49 @@
+import os
+import argparse
+from importlib.metadata import version
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.session import RequestResponder
+
+
+def _responder_exit(self, exc_type, exc_val, exc_tb):
+    try:
+        if self._completed:
+            self._on_complete(self)
+    finally:
+        self._entered = False
+        swallowed = self._cancel_scope.__exit__(exc_type, exc_val, exc_tb)
+    return swallowed
+
+
+def survive_cancelled_requests():
+    """Keep the server running when a client cancels a request.
+
+    mcp 1.9 drops the result of the request's cancel scope on exit, so the cancellation
+    raised by notifications/cancelled escapes the handler and shuts the whole server down.
+    """
+    if version("mcp").startswith("1.9."):
+        RequestResponder.__exit__ = _responder_exit
+
+
+def run_server(mcp: FastMCP, default_port: int):
+    """Run a FastMCP server over stdio, or as a long-lived streamable-HTTP/SSE service.
+
+    The transport comes from --transport or MCP_TRANSPORT. Over HTTP one warm server
+    can be shared by several clients, which connect to http://HOST:PORT/mcp (or /sse).
+    """
+    parser = argparse.ArgumentParser(description=f"{mcp.name} MCP server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "streamable-http", "sse"],
+        default=os.getenv("MCP_TRANSPORT", "stdio"),
+    )
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", default_port)))
+    args = parser.parse_args()
+
+    survive_cancelled_requests()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    if args.transport != "stdio":
+        print(f"{mcp.name} server listening on http://{args.host}:{args.port} ({args.transport})")
+    mcp.run(transport=args.transport)
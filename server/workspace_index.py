@@ -0,0 +1,343 @@
+import os
+import re
+import mmap
+import time
+import fnmatch
+from typing import Iterator, Optional
+
+# Never listed, indexed or searched, in addition to the workspace's .gitignore
+DEFAULT_IGNORE = [
+    ".git/", ".hg/", ".svn/", "node_modules/", "__pycache__/", ".venv/", "venv/",
+    ".mypy_cache/", ".pytest_cache/", ".ruff_cache/", ".tox/", ".idea/", ".DS_Store", "*.pyc",
+]
+# Larger files are still readable with read_file, but aren't indexed for search
+MAX_INDEXED_FILE_BYTES = 1024 * 1024
+MAX_INDEXED_FILES = 50_000
+MAX_LINE_CHARS = 300
+# How much of a file is checked for NUL bytes to decide that it is binary
+BINARY_SNIFF_BYTES = 8192
+
+
+class IgnoreRules:
+    """Gitignore-style name and path patterns: "dir/" matches directories only and a leading
+    "/" anchors a pattern to the root. Negations ("!pattern") aren't supported and are skipped."""
+
+    def __init__(self, root: str, extra: Optional[list[str]] = None):
+        patterns = list(DEFAULT_IGNORE)
+        try:
+            with open(os.path.join(root, ".gitignore"), encoding="utf-8", errors="replace") as f:
+                patterns += [line.strip() for line in f]
+        except OSError:
+            pass
+        patterns += extra or []
+        self.rules = []
+        for pattern in patterns:
+            if not pattern or pattern.startswith(("#", "!")):
+                continue
+            directory_only = pattern.endswith("/")
+            pattern = pattern.strip("/")
+            if pattern:
+                # Patterns with a slash are matched against the whole relative path, others against the name
+                self.rules.append((pattern, "/" in pattern, directory_only))
+
+    def ignored(self, relative_path: str, is_dir: bool) -> bool:
+        name = relative_path.rsplit("/", 1)[-1]
+        for pattern, anchored, directory_only in self.rules:
+            if directory_only and not is_dir:
+                continue
+            if fnmatch.fnmatch(relative_path if anchored else name, pattern):
+                return True
+        return False
+
+
+def walk(root: str, rules: IgnoreRules, relative: str = "") -> Iterator[tuple[str, os.DirEntry]]:
+    """Yield (relative path, entry) for every file under root that isn't ignored, in sorted order."""
+    try:
+        with os.scandir(os.path.join(root, relative)) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        path = f"{relative}/{entry.name}" if relative else entry.name
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            continue
+        if rules.ignored(path, is_dir):
+            continue
+        if is_dir:
+            yield from walk(root, rules, path)
+        elif entry.is_file():
+            yield path, entry
+
+
+def is_binary(data) -> bool:
+    return b"\0" in data[:BINARY_SNIFF_BYTES]
+
+
+WORD = re.compile(rb"\w{3,}")
+
+
+def trigrams(data: bytes) -> set[bytes]:
+    """Lower-cased trigrams of the words in data.
+
+    Only trigrams inside words are kept: a file has far fewer distinct words than bytes,
+    which makes indexing several times faster. Any substring of a word still has all its
+    trigrams in the index, and exact matching happens after narrowing.
+    """
+    grams = set()
+    for word in set(WORD.findall(data.lower())):
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def required_literals(pattern: str) -> list[str]:
+    """Literal runs that every match of a regular expression must contain, for narrowing
+    candidates with the trigram index. Conservative: groups and classes contribute nothing,
+    and alternation gives up entirely."""
+    if "|" in pattern:
+        return []
+    literals, current, i = [], "", 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            escaped = pattern[i + 1:i + 2]
+            if escaped and not escaped.isalnum():
+                current += escaped
+            else:
+                # \d, \w, \b, ... aren't literals
+                literals.append(current)
+                current = ""
+            i += 2
+            continue
+        if char in "*?{":
+            # The preceding character is optional (or repeated an unknown number of times)
+            literals.append(current[:-1])
+            current = ""
+        elif char in "([":
+            literals.append(current)
+            current = ""
+            i = skip_group(pattern, i)
+            continue
+        elif char in ".^$+)]":
+            # "+" keeps the preceding character, but a repeat means the run can't continue past it
+            literals.append(current)
+            current = ""
+        else:
+            current += char
+        i += 1
+    literals.append(current)
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+def skip_group(pattern: str, start: int) -> int:
+    """Index just past the group or class opening at start, plus any quantifier after it."""
+    close = {"(": ")", "[": "]"}[pattern[start]]
+    depth, i = 0, start
+    while i < len(pattern):
+        if pattern[i] == "\\":
+            i += 2
+            continue
+        if pattern[i] == pattern[start]:
+            depth += 1
+        elif pattern[i] == close:
+            depth -= 1
+            if depth == 0:
+                break
+        i += 1
+    i += 1
+    while i < len(pattern) and pattern[i] in "*?+{}0123456789,":
+        i += 1
+    return i
+
+
+class WorkspaceIndex:
+    """In-memory trigram index over the text files of one workspace.
+
+    refresh() re-stats the tree and re-reads only files whose mtime or size changed, so
+    searches after the first one cost a directory walk plus reading the candidate files.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files: dict[str, tuple[int, int]] = {}  # path -> (mtime_ns, size)
+        self.grams: dict[str, set[bytes]] = {}
+        self.postings: dict[bytes, set[str]] = {}
+        self.truncated = False
+
+    def _add(self, path: str, stat: tuple[int, int]):
+        self.files[path] = stat
+        data = b""
+        if 0 < stat[1] <= MAX_INDEXED_FILE_BYTES:
+            try:
+                with open(os.path.join(self.root, path), "rb") as f:
+                    data = f.read()
+            except OSError:
+                pass
+        grams = set() if is_binary(data) else trigrams(data)
+        self.grams[path] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(path)
+
+    def _remove(self, path: str):
+        del self.files[path]
+        for gram in self.grams.pop(path, ()):
+            paths = self.postings[gram]
+            paths.discard(path)
+            if not paths:
+                del self.postings[gram]
+
+    def refresh(self) -> dict:
+        started = time.perf_counter()
+        rules = IgnoreRules(self.root)
+        seen = set()
+        changed = 0
+        self.truncated = False
+        for path, entry in walk(self.root, rules):
+            if len(seen) >= MAX_INDEXED_FILES:
+                self.truncated = True
+                break
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            seen.add(path)
+            key = (stat.st_mtime_ns, stat.st_size)
+            if self.files.get(path) != key:
+                if path in self.files:
+                    self._remove(path)
+                self._add(path, key)
+                changed += 1
+        for path in self.files.keys() - seen:
+            self._remove(path)
+            changed += 1
+        return {"files": len(self.files), "changed": changed, "seconds": time.perf_counter() - started}
+
+    def candidates(self, literals: list[str]) -> Optional[set[str]]:
+        """Files that contain every trigram of every literal; None when the literals don't narrow anything."""
+        result = None
+        for literal in literals:
+            for gram in trigrams(literal.encode()):
+                paths = self.postings.get(gram, set())
+                result = set(paths) if result is None else result & paths
+                if not result:
+                    return set()
+        return result
+
+    def search(
+        self,
+        pattern: re.Pattern,
+        literals: list[str],
+        prefix: str = "",
+        glob: Optional[str] = None,
+        max_results: int = 100,
+    ) -> tuple[list[str], bool]:
+        """Matching lines as "path:line: text", and whether the search stopped at max_results."""
+        paths = self.candidates(literals)
+        if paths is None:
+            # Nothing to narrow with (e.g. a very short query): scan every indexed text file
+            paths = {path for path, grams in self.grams.items() if grams}
+        matches = []
+        for path in sorted(paths):
+            if prefix and not (path == prefix or path.startswith(prefix + "/")):
+                continue
+            if glob and not (fnmatch.fnmatch(path, glob) or fnmatch.fnmatch(path.rsplit("/", 1)[-1], glob)):
+                continue
+            try:
+                with open(os.path.join(self.root, path), encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+            except OSError:
+                continue
+            # Matched line by line, so "^" and "$" anchor to lines as in grep
+            for number, line in enumerate(text.splitlines(), 1):
+                if pattern.search(line):
+                    if len(matches) >= max_results:
+                        return matches, True
+                    matches.append(f"{path}:{number}: {clip(line.strip())}")
+        return matches, False
+
+
+def clip(line: str, limit: int = MAX_LINE_CHARS) -> str:
+    return line if len(line) <= limit else line[:limit] + " …"
+
+
+def read_range(
+    path: str,
+    max_bytes: int,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+) -> str:
+    """Read part of a file through mmap, so a slice of a large file doesn't read the rest of it.
+
+    Lines are 1-based and inclusive; byte ranges take precedence over line ranges. The result
+    is capped at max_bytes, with a note saying how to read further.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if is_binary(data):
+                return f"[binary file, {size} bytes]"
+            if offset is not None or length is not None:
+                start = min(max(offset or 0, 0), size)
+                end = size if length is None else min(start + max(length, 0), size)
+                described = f"bytes {start}-{end}"
+            else:
+                first = max(start_line or 1, 1)
+                start = line_offset(data, first)
+                end = size if end_line is None else line_offset(data, end_line + 1, start, first)
+                described = f"lines {first}-{end_line or 'end'}"
+            chunk = data[start:min(end, start + max_bytes)]
+    text = chunk.decode("utf-8", errors="replace")
+    if end - start > max_bytes:
+        text += (
+            f"\n[truncated: showed bytes {start}-{start + max_bytes} of {described} in a {size}-byte file;"
+            f" continue with offset={start + max_bytes} or a later start_line]"
+        )
+    return text
+
+
+def line_offset(data: mmap.mmap, line: int, start: int = 0, start_line: int = 1) -> int:
+    """Byte offset where a 1-based line begins (the file size past the last line)."""
+    position = start
+    for _ in range(line - start_line):
+        newline = data.find(b"\n", position)
+        if newline < 0:
+            return len(data)
+        position = newline + 1
+    return position
+
+
+def render_tree(root: str, depth: int, extra_ignore: Optional[list[str]] = None, max_entries: int = 500) -> str:
+    """Indented listing of root down to `depth` levels, directories marked with "/"."""
+    rules = IgnoreRules(root, extra_ignore)
+    lines = []
+    omitted = 0
+
+    def visit(relative: str, level: int):
+        nonlocal omitted
+        try:
+            with os.scandir(os.path.join(root, relative)) as scanned:
+                entries = sorted(scanned, key=lambda entry: (not entry.is_dir(follow_symlinks=False), entry.name))
+        except OSError as e:
+            lines.append(f"{'  ' * level}[{e.strerror}]")
+            return
+        for entry in entries:
+            path = f"{relative}/{entry.name}" if relative else entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if rules.ignored(path, is_dir):
+                continue
+            if len(lines) >= max_entries:
+                omitted += 1
+                continue
+            lines.append(f"{'  ' * level}{entry.name}{'/' if is_dir else ''}")
+            if is_dir and level + 1 < depth:
+                visit(path, level + 1)
+
+    visit("", 0)
+    if omitted:
+        lines.append(f"[{omitted} more entries not shown; list a subdirectory or lower the depth]")
+    return "\n".join(lines)